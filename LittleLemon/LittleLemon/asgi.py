@@ -8,9 +8,18 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 
 import os
+import time
 
-from django.core.asgi import get_asgi_application
+started = time.perf_counter()
+
+from django.core.asgi import get_asgi_application  # noqa: E402
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings')
 
 application = get_asgi_application()
+
+# Warms up when settings.WARM_UP_ON_START is set, and logs the time to the
+# first response (see LittleLemonAPI.startup)
+from LittleLemonAPI.startup import asgi_startup  # noqa: E402
+
+application = asgi_startup(application, started)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,11 +46,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the stack
+    'LittleLemonAPI.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Pins a user who just wrote to the primary (see LittleLemonAPI.routers)
+    'LittleLemonAPI.routers.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -82,9 +87,53 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # A read replica is another alias listed in DATABASE_REPLICAS, e.g.
+    # 'replica': {
+    #     'ENGINE': 'django.db.backends.sqlite3',
+    #     'NAME': BASE_DIR / 'replica.sqlite3',
+    #     'CONN_MAX_AGE': 600,
+    #     'CONN_HEALTH_CHECKS': True,
+    # },
 }
 
+# The cache shared by every worker. Token, role and menu caches, replica pins,
+# idempotency keys and cart locks are all invalidated through it, so with
+# more than one worker process it must be shared: set REDIS_URL (needs the
+# redis package). Without it each process caches on its own, which is only
+# right for a single process (`check --deploy` warns about it).
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
+# Order-list reads go to a healthy replica unless the user wrote within
+# REPLICA_PIN_SECONDS (see LittleLemonAPI.routers and ReplicaPinMiddleware
+# above). Menu and category reads are served from the menu cache, filled
+# from the primary.
+DATABASE_ROUTERS = ['LittleLemonAPI.routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 10
+REPLICA_HEALTH_CHECK_INTERVAL = 5
+
+# Delivered orders older than ORDER_ARCHIVE_DAYS are moved to the archive
+# tables by the archive_orders command, in ARCHIVE_DATABASE (another alias
+# in DATABASES to keep them off the primary). See LittleLemonAPI.archive.
+ARCHIVE_DATABASE = 'default'
+ORDER_ARCHIVE_DAYS = 365
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -131,12 +180,17 @@ INTERNAL_IPS = [
     '127.0.0.1',
 ]
 
+# Addresses allowed to scrape /metrics; superusers always can
+# (see LittleLemonAPI.profiling)
+METRICS_ALLOWED_IPS = INTERNAL_IPS
+
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
-        'rest_framework_xml.renderers.XMLRenderer',
+        # Imported on first use (see LittleLemonAPI.renderers)
+        'LittleLemonAPI.renderers.BrowsableAPIRenderer',
+        'LittleLemonAPI.renderers.XMLRenderer',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -144,7 +198,7 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'LittleLemonAPI.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         # 'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
@@ -156,7 +210,76 @@ REST_FRAMEWORK = {
     }
 }
 
+# Shared token-bucket state for LittleLemonAPI.throttling. Use
+# 'LittleLemonAPI.throttling.RedisThrottleStore' with {'url': 'redis://...'}
+# when workers run on more than one host.
+THROTTLE_STORE = {
+    'BACKEND': 'LittleLemonAPI.throttling.SQLiteThrottleStore',
+    'OPTIONS': {
+        'path': BASE_DIR / 'throttle.sqlite3',
+    },
+}
+
+# Where carts live. 'LittleLemonAPI.carts.CacheCartStore' keeps them in the
+# cache (shared Redis/Memcached) and writes Cart rows only from the
+# flush_carts command and at checkout.
+CART_STORE = {
+    'BACKEND': 'LittleLemonAPI.carts.DatabaseCartStore',
+    'OPTIONS': {},
+}
+
+# Pub/sub broker behind /api/orders/events, which also keeps recent events
+# for clients resuming from an event id. The in-process broker only serves
+# a single worker process (see the LittleLemonAPI.W002 check).
+if REDIS_URL:
+    ORDER_EVENTS = {
+        'BACKEND': 'LittleLemonAPI.events.RedisBroker',
+        'OPTIONS': {'url': REDIS_URL},
+    }
+else:
+    ORDER_EVENTS = {
+        'BACKEND': 'LittleLemonAPI.events.InProcessBroker',
+        'OPTIONS': {},
+    }
+
+# Worker processes per host, as gunicorn reads it
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+
+# Seconds between keep-alive comments on an idle order event stream, and
+# the longest a long poll for order events holds a WSGI worker
+ORDER_EVENTS_HEARTBEAT = 15
+ORDER_EVENTS_POLL_TIMEOUT = 10
+
 
 DJOSER = {
     'USER_ID_FIELD': 'username',
 }
+
+# Serve menu/category lists through generated serializers working on
+# .values() rows (see LittleLemonAPI.compiled)
+COMPILED_SERIALIZERS = True
+
+# Seconds a cached menu/category response lives (see LittleLemonAPI.caching)
+MENU_CACHE_TTL = 60 * 60
+
+# Seconds a user's group memberships are cached for (see LittleLemonAPI.roles)
+ROLE_CACHE_TTL = 300
+
+# Seconds a token's user is cached for in the shared cache, and in each
+# process's LRU of TOKEN_LOCAL_SIZE tokens (see LittleLemonAPI.authentication)
+TOKEN_CACHE_TTL = 300
+TOKEN_LOCAL_TTL = 5
+TOKEN_LOCAL_SIZE = 10000
+
+# Seconds an Idempotency-Key's first response is replayed for, and how long
+# a retry waits on the original (see LittleLemonAPI.idempotency)
+IDEMPOTENCY_TTL = 24 * 60 * 60
+IDEMPOTENCY_WAIT = 10
+
+# Build URL, model, renderer and serializer caches when wsgi.py/asgi.py load,
+# before the server forks workers (see LittleLemonAPI.startup). Turn on in
+# production along with gunicorn --preload or uwsgi's master preload.
+WARM_UP_ON_START = False
+
+# Seconds from boot to a worker's first response before a warning is logged
+STARTUP_BUDGET = 2.0
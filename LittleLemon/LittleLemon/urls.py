@@ -16,9 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from LittleLemonAPI.profiling import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics),
     path('api/', include('LittleLemonAPI.urls')),
     path('api/', include('djoser.urls')),
     path('api/', include('djoser.urls.authtoken')),
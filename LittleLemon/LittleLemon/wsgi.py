@@ -8,9 +8,18 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 """
 
 import os
+import time
 
-from django.core.wsgi import get_wsgi_application
+started = time.perf_counter()
+
+from django.core.wsgi import get_wsgi_application  # noqa: E402
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings')
 
 application = get_wsgi_application()
+
+# Warms up when settings.WARM_UP_ON_START is set, and logs the time to the
+# first response (see LittleLemonAPI.startup)
+from LittleLemonAPI.startup import wsgi_startup  # noqa: E402
+
+application = wsgi_startup(application, started)
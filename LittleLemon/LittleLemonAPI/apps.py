@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
 
 
 class LittlelemonapiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'LittleLemonAPI'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        post_migrate.connect(restore_search_index, sender=self)
+
+
+def restore_search_index(sender, using, **kwargs):
+    from .search import install_search_index
+    install_search_index(connections[using], create=False)
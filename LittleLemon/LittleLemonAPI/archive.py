@@ -0,0 +1,76 @@
+import datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import router, transaction
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+from .roles import is_delivery_crew, is_manager
+from .rollups import sales_kept
+
+# Delivered orders older than this many days are moved to the archive
+ORDER_ARCHIVE_DAYS = getattr(settings, 'ORDER_ARCHIVE_DAYS', 365)
+ARCHIVE_BATCH_SIZE = 1000
+
+ORDER_FIELDS = ['id', 'user_id', 'delivery_crew_id', 'status', 'total', 'date']
+ITEM_FIELDS = ['id', 'order_id', 'menuitem_id', 'quantity', 'unit_price', 'price']
+
+
+def archive_orders(days=ORDER_ARCHIVE_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    # Move delivered orders dated more than `days` ago, with their lines,
+    # into ArchivedOrder/ArchivedOrderItem, oldest first and `batch_size`
+    # orders per transaction. Safe to stop and rerun at any point: a batch
+    # is copied before it is deleted, and copies of rows already archived
+    # are skipped. Sales rollups are left alone, as the sales happened, and
+    # rebuild_sales_rollups() counts archived orders too.
+    # Yields the number of orders moved by each batch.
+    horizon = datetime.date.today() - datetime.timedelta(days=days)
+    hot = router.db_for_write(Order)
+    cold = router.db_for_write(ArchivedOrder)
+    while True:
+        with transaction.atomic(using=hot):
+            orders = list(Order.objects.select_for_update().filter(
+                status=True, date__lt=horizon).order_by(
+                'date', 'id').values(*ORDER_FIELDS)[:batch_size])
+            if not orders:
+                return
+            ids = [order['id'] for order in orders]
+            items = list(OrderItem.objects.filter(order_id__in=ids).values(*ITEM_FIELDS))
+
+            # Commits on its own when the archive is another database
+            with transaction.atomic(using=cold):
+                ArchivedOrder.objects.bulk_create(
+                    [ArchivedOrder(**order) for order in orders], ignore_conflicts=True)
+                ArchivedOrderItem.objects.bulk_create(
+                    [ArchivedOrderItem(**item) for item in items], ignore_conflicts=True)
+
+            with sales_kept():
+                OrderItem.objects.filter(order_id__in=ids).delete()
+                Order.objects.filter(id__in=ids).delete()
+        yield len(orders)
+
+
+def archived_orders(user, columns):
+    # The caller's archived orders, scoped like OrderView.get, as rows with
+    # the same `columns` as its hot ones (see add_usernames)
+    orders = ArchivedOrder.objects.all()
+    if is_manager(user):
+        pass
+    elif is_delivery_crew(user):
+        orders = orders.filter(delivery_crew_id=user.pk)
+    else:
+        orders = orders.filter(user_id=user.pk)
+    return orders.values(*['user_id' if column == 'user__username' else column
+                           for column in columns])
+
+
+def add_usernames(rows):
+    # Archived rows carry user ids; look their usernames up in one query,
+    # as the archive may be in another database
+    ids = {row['user_id'] for row in rows or () if 'user_id' in row}
+    if not ids:
+        return
+    usernames = dict(User.objects.filter(id__in=ids).values_list('id', 'username'))
+    for row in rows:
+        if 'user_id' in row:
+            row['user__username'] = usernames.get(row.pop('user_id'))
@@ -0,0 +1,324 @@
+# Async versions of the hot read endpoints, mounted under /api/async/.
+#
+# They return the same JSON as the DRF views in views.py, but run their
+# queries through Django's async ORM so an ASGI worker can keep many
+# requests in flight instead of funnelling each one through the
+# thread-sensitive sync adapter. Only JSON is rendered; authentication is
+# by token (or session), and the DRF view's throttles still apply.
+
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.core.paginator import InvalidPage, Paginator
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+
+from .authentication import aget_token
+from .events import ORDER_EVENTS_HEARTBEAT, ORDER_EVENTS_POLL_TIMEOUT, can_see, get_broker
+from .caching import MENU_CACHE_TTL, aget_menu_version, etag_matches, menu_cache_key
+from .carts import CART_FIELDS, get_cart_store
+from .models import Category, MenuItem, Order
+from .profiling import rendering
+from .search import MenuSearchFilter
+from .sparse import project, requested_fields, trim
+from .roles import ais_delivery_crew, ais_manager
+from .routers import aenable_replica_reads
+from .serializers import CategorySerializer, MenuItemSerializer
+from . import views
+from .views import ORDER_COLUMNS, ORDER_FIELDS
+
+
+class AsyncReadView(View):
+    # Subclasses define `async def read(self, request, view, *args,
+    # **kwargs)`, returning (status, data) for the DRF `request` and an
+    # instance `view` of sync_view set up for it.
+
+    # The DRF view whose throttles, filters and pagination are mirrored
+    sync_view = None
+    authenticated_only = False
+    # Serve through the versioned menu cache (see caching.MenuCacheMixin)
+    menu_cache = False
+    # Read from a replica, as with routers.ReplicaReadMixin. Not with
+    # menu_cache: misses are filled from the primary (see MenuCacheMixin).
+    replica_reads = False
+
+    http_method_names = ['get', 'head', 'options']
+
+    async def get(self, request, *args, **kwargs):
+        drf_request = Request(request)
+
+        user = await authenticate(request)
+        if user is None:
+            return render({'detail': 'Invalid token.'}, 401,
+                          {'WWW-Authenticate': 'Token'})
+        drf_request.user = user
+        if self.authenticated_only and not user.is_authenticated:
+            return render({'detail': 'Authentication credentials were not provided.'},
+                          401, {'WWW-Authenticate': 'Token'})
+
+        view = self.sync_view()
+        view.setup(drf_request, *args, **kwargs)
+        view.format_kwarg = None
+        throttled = await check_throttles(drf_request, view)
+        if throttled is not None:
+            return throttled
+        if self.replica_reads and not self.menu_cache:
+            await aenable_replica_reads(user)
+
+        if not self.menu_cache:
+            status, data = await self._read(drf_request, view, *args, **kwargs)
+            return render(data, status)
+
+        key = menu_cache_key(await aget_menu_version(), 'json',
+                             request.build_absolute_uri())
+        etag = f'"{key}"'
+        if etag_matches(request, etag):
+            return HttpResponse(status=304, headers={'ETag': etag})
+        data = await cache.aget(f'menu:data:{key}')
+        if data is None:
+            status, data = await self._read(drf_request, view, *args, **kwargs)
+            if status != 200:
+                return render(data, status)
+            await cache.aset(f'menu:data:{key}', data, MENU_CACHE_TTL)
+        return render(data, 200, {'ETag': etag})
+
+    async def _read(self, request, view, *args, **kwargs):
+        try:
+            return await self.read(request, view, *args, **kwargs)
+        except ValidationError as exc:
+            # e.g. an unknown ?fields= name
+            return 400, exc.detail
+
+
+async def authenticate(request):
+    # Token first, as in DEFAULT_AUTHENTICATION_CLASSES, then the session.
+    # Returns None for a bad token.
+    header = request.headers.get('Authorization', '').split()
+    if header and header[0].lower() == 'token':
+        if len(header) != 2:
+            return None
+        token = await aget_token(header[1])
+        if token is None:
+            return None
+        return token.user if token.user.is_active else None
+    if request.session.session_key:
+        return await sync_to_async(get_user)(request)
+    return AnonymousUser()
+
+
+async def check_throttles(request, view):
+    # The view's throttles, run off the event loop as their stores block.
+    # Returns a 429 response, or None if the request may go ahead.
+    def wait():
+        for throttle in view.get_throttles():
+            if not throttle.allow_request(request, view):
+                return int(throttle.wait() or 0)
+        return None
+
+    seconds = await sync_to_async(wait)()
+    if seconds is None:
+        return None
+    return render({'detail': 'Request was throttled. Expected available in '
+                   f'{seconds} seconds.'}, 429)
+
+
+def render(data, status=200, headers=None):
+    with rendering('json'):
+        content = JSONRenderer().render(data)
+    return HttpResponse(content, status=status,
+                        headers=headers, content_type='application/json')
+
+
+class CategoriesView(AsyncReadView):
+    sync_view = views.CategoriesView
+    menu_cache = True
+
+    async def read(self, request, view):
+        paginator = view.paginator
+        queryset = view.get_queryset()
+        page_size = paginator.get_page_size(request)
+
+        # PageNumberPagination, with the count and page read asynchronously
+        django_paginator = Paginator(queryset, page_size)
+        django_paginator.count = await queryset.acount()
+        try:
+            page = django_paginator.page(
+                paginator.get_page_number(request, django_paginator))
+        except InvalidPage:
+            return 404, {'detail': 'Invalid page.'}
+        page.object_list = [category async for category in page.object_list]
+
+        paginator.request = request
+        paginator.page = page
+        data = trim(CategorySerializer(page.object_list, many=True),
+                    view.sparse_fields()).data
+        return 200, paginator.get_paginated_response(data).data
+
+
+class MenuItemsView(AsyncReadView):
+    sync_view = views.MenuItemsView
+    menu_cache = True
+
+    async def read(self, request, view):
+        fields = view.sparse_fields()
+        if fields is None:
+            queryset = MenuItem.objects.select_related('Category')
+        else:
+            queryset = MenuItem.objects.all()
+            queryset = project(queryset, MenuItemSerializer,
+                               fields, view.sparse_keep(queryset))
+
+        category = request.query_params.get('Category')
+        if category:
+            if not category.isdigit() or not await Category.objects.filter(
+                    pk=category).aexists():
+                return 400, {'Category': ['Select a valid choice. That choice '
+                                          'is not one of the available choices.']}
+            queryset = queryset.filter(Category=category)
+        # The first search checks for the index with a sync query
+        queryset = await sync_to_async(MenuSearchFilter().filter_queryset)(
+            request, queryset, view)
+
+        page = await view.paginator.apaginate_queryset(queryset, request, view)
+        data = trim(MenuItemSerializer(page, many=True), fields).data
+        return 200, view.paginator.get_paginated_response(data).data
+
+
+class SingleMenuItemsView(AsyncReadView):
+    sync_view = views.SingleMenuItemsView
+    authenticated_only = True
+    menu_cache = True
+
+    async def read(self, request, view, pk):
+        try:
+            item = await MenuItem.objects.select_related('Category').aget(pk=pk)
+        except MenuItem.DoesNotExist:
+            # Word the 404 the way get_object_or_404 + DRF would
+            response = exception_handler(Http404(
+                'No MenuItem matches the given query.'), {})
+            return response.status_code, response.data
+        return 200, MenuItemSerializer(item).data
+
+
+class CartView(AsyncReadView):
+    sync_view = views.CartView
+    authenticated_only = True
+
+    async def read(self, request, view):
+        fields = requested_fields(request.query_params, CART_FIELDS) or CART_FIELDS
+        queryset = await get_cart_store().aitems(request.user, fields)
+        if queryset:
+            return 200, {'details': queryset}
+        return 404, '404 - Not found'
+
+
+class OrderView(AsyncReadView):
+    sync_view = views.OrderView
+    replica_reads = True
+    authenticated_only = True
+
+    async def read(self, request, view):
+        user = request.user
+        if await ais_manager(user):
+            orders = Order.objects.all()
+        elif await ais_delivery_crew(user):
+            orders = Order.objects.filter(delivery_crew=user)
+        else:
+            orders = Order.objects.filter(user=user)
+        fields = requested_fields(request.query_params, ORDER_FIELDS) or ORDER_FIELDS
+        columns = dict.fromkeys([ORDER_COLUMNS[field] for field in fields] + ['date', 'id'])
+        orders = await view.paginator.apaginate_queryset(
+            orders.values(*columns), request, view)
+        if orders or view.paginator.cursor is not None:
+            queryset = [{field: order[ORDER_COLUMNS[field]] for field in fields}
+                        for order in orders]
+            return 200, view.paginator.get_paginated_response(queryset).data
+        return 404, '404 - Not found'
+
+
+class OrderEventsView(View):
+    # Server-sent events for order changes, in place of polling /orders:
+    # every update, assignment or deletion of an order the caller could
+    # see there. Serve under asgi.py; each stream holds no worker thread.
+    # Under WSGI, which would buffer an endless stream before sending a
+    # byte, it answers as a long poll instead: the next such event as JSON,
+    # or 204 after ?timeout= seconds (at most, and by default,
+    # ORDER_EVENTS_POLL_TIMEOUT).
+    #
+    # Every event has an id. A client resuming with ?since=<id> (or, for a
+    # stream, the Last-Event-ID header browsers send on reconnect) first
+    # gets the events it missed, or a 'reset' event if they are no longer
+    # kept, after which it should re-read /orders.
+    http_method_names = ['get']
+
+    async def get(self, request):
+        user = await authenticate(request)
+        if user is None or not user.is_authenticated:
+            return render({'detail': 'Authentication credentials were not provided.'},
+                          401, {'WWW-Authenticate': 'Token'})
+        drf_request = Request(request)
+        drf_request.user = user
+        view = views.OrderView()
+        view.setup(drf_request)
+        throttled = await check_throttles(drf_request, view)
+        if throttled is not None:
+            return throttled
+
+        if await ais_manager(user):
+            role = 'manager'
+        elif await ais_delivery_crew(user):
+            role = 'delivery_crew'
+        else:
+            role = 'customer'
+
+        since = request.GET.get('since', request.headers.get('Last-Event-ID'))
+        if not isinstance(request, ASGIRequest):
+            try:
+                timeout = int(request.GET.get('timeout', ORDER_EVENTS_POLL_TIMEOUT))
+            except ValueError:
+                timeout = None
+            if timeout is None or not 0 <= timeout <= ORDER_EVENTS_POLL_TIMEOUT:
+                return render("field : 'timeout' must be a number from 0 to "
+                              f'{ORDER_EVENTS_POLL_TIMEOUT}', 400)
+            return await self.poll(user.pk, role, timeout, since)
+        response = StreamingHttpResponse(
+            self.stream(user.pk, role, since), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, user_id, role, since):
+        # Comment lines keep idle connections open through proxies
+        yield ': connected\n\n'
+        async for event in get_broker().subscribe(ORDER_EVENTS_HEARTBEAT, since):
+            if event is None:
+                yield ': keep-alive\n\n'
+            elif can_see(event, user_id, role):
+                yield (f'id: {event["id"]}\nevent: {event["event"]}\n'
+                       f'data: {json.dumps(event["order"])}\n\n')
+
+    async def poll(self, user_id, role, timeout, since):
+        events = get_broker().subscribe(ORDER_EVENTS_POLL_TIMEOUT, since)
+        try:
+            async with asyncio.timeout(timeout):
+                async for event in events:
+                    if event is None:
+                        break
+                    if can_see(event, user_id, role):
+                        return render({'id': event['id'], 'event': event['event'],
+                                       'order': event['order']})
+        except TimeoutError:
+            pass
+        finally:
+            await events.aclose()
+        return HttpResponse(status=204)
@@ -0,0 +1,125 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+# How long a token's user stays in the shared cache
+TOKEN_CACHE_TTL = getattr(settings, 'TOKEN_CACHE_TTL', 300)
+# How long, and for how many tokens, each process keeps its own copy. With
+# a shared cache (see settings.CACHES) this bounds how long another worker
+# can go on accepting a revoked token.
+TOKEN_LOCAL_TTL = getattr(settings, 'TOKEN_LOCAL_TTL', 5)
+TOKEN_LOCAL_SIZE = getattr(settings, 'TOKEN_LOCAL_SIZE', 10000)
+
+
+class LRUCache:
+    # A bounded, thread-safe mapping whose entries expire after `ttl` seconds
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_local = LRUCache(TOKEN_LOCAL_SIZE, TOKEN_LOCAL_TTL)
+
+
+def _cache_key(key):
+    # Never put the token itself in a cache key
+    return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def _copy(token):
+    # Each request gets its own instances, so per-request state memoised on
+    # request.user (e.g. roles) never leaks into the cached one
+    token = copy.copy(token)
+    token.user = copy.copy(token.user)
+    return token
+
+
+def get_token(key):
+    # The Token (with its user) for `key`, or None. Served from this
+    # process, then the shared cache, then one token-join-user query.
+    cache_key = _cache_key(key)
+    token = _local.get(cache_key)
+    if token is None:
+        token = cache.get(cache_key)
+        if token is None:
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                return None
+            cache.set(cache_key, token, TOKEN_CACHE_TTL)
+        _local.set(cache_key, token)
+    return _copy(token)
+
+
+async def aget_token(key):
+    # get_token for async views
+    cache_key = _cache_key(key)
+    token = _local.get(cache_key)
+    if token is None:
+        token = await cache.aget(cache_key)
+        if token is None:
+            try:
+                token = await Token.objects.select_related('user').aget(key=key)
+            except Token.DoesNotExist:
+                return None
+            await cache.aset(cache_key, token, TOKEN_CACHE_TTL)
+        _local.set(cache_key, token)
+    return _copy(token)
+
+
+def invalidate_token(key):
+    cache_key = _cache_key(key)
+    cache.delete(cache_key)
+    _local.delete(cache_key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    # TokenAuthentication without the per-request query. Deleting a token
+    # (including djoser's logout) and saving or deleting its user drop the
+    # cached entry (see signals.py).
+
+    def authenticate_credentials(self, key):
+        token = get_token(key)
+        if token is None:
+            raise AuthenticationFailed('Invalid token.')
+        if not token.user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+        return (token.user, token)
@@ -0,0 +1,83 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from .routers import primary_reads
+
+MENU_VERSION_KEY = 'menu:version'
+
+# How long a rendered-ready menu/category payload stays cached
+MENU_CACHE_TTL = getattr(settings, 'MENU_CACHE_TTL', 60 * 60)
+
+
+def _fresh_version():
+    # Seed from the clock so a lost version key never resurrects old entries
+    return time.time_ns()
+
+
+def get_menu_version():
+    version = cache.get(MENU_VERSION_KEY)
+    if version is None:
+        cache.add(MENU_VERSION_KEY, _fresh_version(), None)
+        version = cache.get(MENU_VERSION_KEY)
+    return version
+
+
+async def aget_menu_version():
+    version = await cache.aget(MENU_VERSION_KEY)
+    if version is None:
+        await cache.aadd(MENU_VERSION_KEY, _fresh_version(), None)
+        version = await cache.aget(MENU_VERSION_KEY)
+    return version
+
+
+def bump_menu_version():
+    try:
+        cache.incr(MENU_VERSION_KEY)
+    except ValueError:
+        cache.set(MENU_VERSION_KEY, _fresh_version(), None)
+
+
+def menu_cache_key(version, renderer_format, uri):
+    return hashlib.md5(
+        f'{version}|{renderer_format}|{uri}'.encode()).hexdigest()
+
+
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    return '*' in tags or etag in tags
+
+
+class MenuCacheMixin:
+    # Serves GETs from a cache keyed on the menu version, so conditional
+    # requests and repeat reads skip the ORM and the serializers entirely.
+    # Any save/delete of a MenuItem or Category bumps the version
+    # (see signals.py). Misses are filled from the primary: a lagging
+    # replica would put old data under the new version for MENU_CACHE_TTL.
+
+    def get(self, request, *args, **kwargs):
+        key = menu_cache_key(get_menu_version(),
+                             request.accepted_renderer.format,
+                             request.build_absolute_uri())
+        etag = f'"{key}"'
+
+        if etag_matches(request, etag):
+            return Response(status=304, headers={'ETag': etag})
+
+        data = cache.get(f'menu:data:{key}')
+        if data is None:
+            with primary_reads():
+                response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cache.set(f'menu:data:{key}', response.data, MENU_CACHE_TTL)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        return response
@@ -0,0 +1,313 @@
+import time
+import uuid
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import APIException
+
+from .models import Cart, MenuItem
+from .sparse import pick
+from .upserts import bulk_upsert_add
+
+# CartView's response fields, and the columns they are read from
+CART_COLUMNS = {
+    'id': 'id',
+    'menuitem': 'menuitem__title',
+    'quantity': 'quantity',
+    'unit_price': 'unit_price',
+    'price': 'price',
+    'user': 'user__username',
+}
+CART_FIELDS = tuple(CART_COLUMNS)
+
+
+def _merge(lines):
+    quantities = {}
+    for menuitem_id, quantity in lines:
+        quantities[menuitem_id] = quantities.get(menuitem_id, 0) + quantity
+    return quantities
+
+
+def _rows(user, quantities):
+    # One price lookup for every line; None if a menu item doesn't exist
+    prices = dict(MenuItem.objects.filter(
+        pk__in=list(quantities)).values_list('id', 'price'))
+    if len(prices) != len(quantities):
+        return None
+    return [{'user': user.pk,
+             'menuitem': menuitem_id,
+             'quantity': quantity,
+             'unit_price': prices[menuitem_id],
+             'price': prices[menuitem_id] * quantity}
+            for menuitem_id, quantity in quantities.items()]
+
+
+class DatabaseCartStore:
+    # Carts as Cart rows; every add and clear is a write
+
+    def add(self, user, lines):
+        # Add `lines` ((menuitem_id, quantity) pairs) in two queries: one
+        # price lookup and one upsert that adds to any quantity and price
+        # already in the cart. Returns the added rows, or None if a menu
+        # item doesn't exist.
+        rows = _rows(user, _merge(lines))
+        if rows is None:
+            return None
+        bulk_upsert_add(Cart, rows, unique_fields=['user', 'menuitem'],
+                        add_fields=['quantity', 'price'], set_fields=['unit_price'])
+        return rows
+
+    def line(self, user, menuitem_id):
+        return Cart.objects.get(user=user, menuitem_id=menuitem_id)
+
+    def items(self, user, fields=CART_FIELDS):
+        # One joined query; only the columns of the requested `fields`, and
+        # no joins for the ones not requested
+        useritems = Cart.objects.filter(user=user.id).values(
+            *[CART_COLUMNS[field] for field in fields])
+        return [_item(useritem, fields) for useritem in useritems]
+
+    async def aitems(self, user, fields=CART_FIELDS):
+        useritems = Cart.objects.filter(user=user.id).values(
+            *[CART_COLUMNS[field] for field in fields])
+        return [_item(useritem, fields) async for useritem in useritems]
+
+    def clear(self, user):
+        Cart.objects.filter(user=user).delete()
+
+    @contextmanager
+    def take(self, user):
+        # The cart's (menuitem_id, quantity, unit_price, price, category_id)
+        # lines, for checkout in the transaction the block runs in; the
+        # lines are removed from the cart if the block succeeds. Lock the
+        # cart rows so a concurrent add/clear can't change them between
+        # reading the lines and removing them (but not the menu items joined
+        # in for their category). A line added meanwhile is a new row, so
+        # only the rows read are deleted.
+        # MariaDB can't lock some tables of a join only; it locks them all
+        if connections[router.db_for_write(Cart)].features.has_select_for_update_of:
+            carts = Cart.objects.select_for_update(of=('self',))
+        else:
+            carts = Cart.objects.select_for_update()
+        with transaction.atomic():
+            rows = list(carts.filter(
+                user=user).values_list(
+                'id', 'menuitem_id', 'quantity', 'unit_price', 'price',
+                'menuitem__Category_id'))
+            yield [row[1:] for row in rows]
+            if rows:
+                Cart.objects.filter(pk__in=[row[0] for row in rows]).delete()
+
+    def flush(self):
+        return 0
+
+
+def _item(useritem, fields):
+    return {field: useritem[CART_COLUMNS[field]] for field in fields}
+
+
+class CartBusy(APIException):
+    status_code = 409
+    default_detail = 'The cart is being changed by another request. Try again.'
+    default_code = 'cart_busy'
+
+
+class CacheCartStore:
+    # Carts held in the cache as {menuitem_id: (quantity, unit_price,
+    # price)}, so adds and clears never write to the database. Cart rows
+    # are only written by flush() (run periodically with the flush_carts
+    # command, for durability) and deleted at checkout, which reads its
+    # lines straight from the cache. A cart missing from the cache (evicted,
+    # or never loaded) is read back from its last flushed rows. Needs a
+    # cache shared by every worker, such as Redis or Memcached.
+    #
+    # Cart lines have no row id in this mode; CartView reports the menu
+    # item id as the line id.
+
+    # Carts changed since the last flush, as an append-only log: slot n
+    # holds a user id, DIRTY_SEQ counts the slots taken and DIRTY_FLUSHED
+    # the slots flushed. Slots are taken with an atomic incr, so adds for
+    # different users never wait on each other, and a per-user marker keeps
+    # a cart that keeps changing to one slot per flush.
+    DIRTY_SEQ = 'cart:dirty:seq'
+    DIRTY_FLUSHED = 'cart:dirty:flushed'
+    DIRTY_GAP = 'cart:dirty:gap'
+    FLUSH_BATCH_SIZE = 1000
+
+    def __init__(self, ttl=7 * 24 * 60 * 60, lock_timeout=5):
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+
+    def _key(self, user_id):
+        return f'cart:{user_id}'
+
+    def _slot_key(self, slot):
+        return f'cart:dirty:{slot}'
+
+    def _marker_key(self, user_id):
+        return f'cart:dirty:user:{user_id}'
+
+    def _mark_dirty(self, user_id):
+        if cache.add(self._marker_key(user_id), True, self.ttl):
+            cache.add(self.DIRTY_SEQ, 0, None)
+            cache.set(self._slot_key(cache.incr(self.DIRTY_SEQ)), user_id, None)
+
+    @contextmanager
+    def _lock(self, name):
+        # A short cache lock around read-modify-write; a holder that dies
+        # releases it after lock_timeout seconds. Raises CartBusy rather
+        # than going ahead unlocked if it can't be had by then.
+        key = f'cart:lock:{name}'
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        while not cache.add(key, token, self.lock_timeout):
+            if time.monotonic() >= deadline:
+                raise CartBusy()
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            # Only if still ours: it may have expired and been taken since
+            if cache.get(key) == token:
+                cache.delete(key)
+
+    def _load(self, user_id):
+        cart = cache.get(self._key(user_id))
+        if cart is None:
+            cart = {menuitem_id: (quantity, unit_price, price)
+                    for menuitem_id, quantity, unit_price, price in
+                    Cart.objects.filter(user_id=user_id).values_list(
+                        'menuitem_id', 'quantity', 'unit_price', 'price')}
+            cache.set(self._key(user_id), cart, self.ttl)
+        return cart
+
+    def _save(self, user_id, cart):
+        cache.set(self._key(user_id), cart, self.ttl)
+        self._mark_dirty(user_id)
+
+    def add(self, user, lines):
+        rows = _rows(user, _merge(lines))
+        if rows is None:
+            return None
+        with self._lock(user.pk):
+            cart = self._load(user.pk)
+            for row in rows:
+                quantity, _, price = cart.get(row['menuitem'], (0, None, 0))
+                cart[row['menuitem']] = (quantity + row['quantity'],
+                                         row['unit_price'], price + row['price'])
+            self._save(user.pk, cart)
+        return rows
+
+    def line(self, user, menuitem_id):
+        quantity, unit_price, price = self._load(user.pk)[menuitem_id]
+        return Cart(pk=menuitem_id, user=user, menuitem_id=menuitem_id,
+                    quantity=quantity, unit_price=unit_price, price=price)
+
+    def items(self, user, fields=CART_FIELDS):
+        cart = self._load(user.pk)
+        titles = dict(MenuItem.objects.filter(
+            pk__in=list(cart)).values_list('id', 'title'))
+        return pick([{'id': menuitem_id,
+                      'menuitem': titles.get(menuitem_id),
+                      'quantity': quantity,
+                      'unit_price': unit_price,
+                      'price': price,
+                      'user': user.username}
+                     for menuitem_id, (quantity, unit_price, price) in sorted(cart.items())
+                     # Items since taken off the menu, as the database would cascade
+                     if menuitem_id in titles], fields)
+
+    async def aitems(self, user, fields=CART_FIELDS):
+        return await sync_to_async(self.items)(user, fields)
+
+    def clear(self, user):
+        with self._lock(user.pk):
+            self._save(user.pk, {})
+
+    @contextmanager
+    def take(self, user):
+        # The lock is held until the transaction has committed and the
+        # cached cart is emptied, so no add lands in between
+        with self._lock(user.pk), transaction.atomic():
+            cart = self._load(user.pk)
+            categories = dict(MenuItem.objects.filter(
+                pk__in=list(cart)).values_list('id', 'Category_id'))
+            lines = [(menuitem_id, quantity, unit_price, price, categories[menuitem_id])
+                     for menuitem_id, (quantity, unit_price, price) in cart.items()
+                     if menuitem_id in categories]
+            yield lines
+            if lines:
+                # Flushed rows would otherwise come back as the cart
+                Cart.objects.filter(user=user).delete()
+                transaction.on_commit(
+                    lambda: cache.set(self._key(user.pk), {}, self.ttl))
+
+    def flush(self):
+        # Write every cart changed since the last flush to Cart rows.
+        # Returns the number of carts written; a cart that stays locked is
+        # logged again for the next flush.
+        start = cache.get(self.DIRTY_FLUSHED, 0)
+        end = cache.get(self.DIRTY_SEQ, 0)
+        if end < start:
+            # The sequence was lost (e.g. evicted) and started over
+            start = 0
+        flushed = 0
+        for first in range(start + 1, end + 1, self.FLUSH_BATCH_SIZE):
+            slots = range(first, min(first + self.FLUSH_BATCH_SIZE, end + 1))
+            found = cache.get_many([self._slot_key(slot) for slot in slots])
+            done = []
+            for slot in slots:
+                key = self._slot_key(slot)
+                if key not in found:
+                    if cache.get(self.DIRTY_GAP) != slot:
+                        # Most likely taken but not written yet; wait for it
+                        # until the next flush, then give it up as lost
+                        cache.set(self.DIRTY_GAP, slot, None)
+                        self._flushed(done, slot - 1)
+                        return flushed
+                    continue
+                flushed += self._flush_cart(found[key])
+                done.append(key)
+            self._flushed(done, slots[-1])
+        return flushed
+
+    def _flushed(self, keys, slot):
+        cache.delete_many(keys)
+        cache.set(self.DIRTY_FLUSHED, slot, None)
+
+    def _flush_cart(self, user_id):
+        # Unmarked first, so a change made from here on is logged again
+        cache.delete(self._marker_key(user_id))
+        try:
+            with self._lock(user_id), transaction.atomic():
+                cart = cache.get(self._key(user_id))
+                if cart is None:
+                    return 0
+                Cart.objects.filter(user_id=user_id).delete()
+                Cart.objects.bulk_create([
+                    Cart(user_id=user_id, menuitem_id=menuitem_id, quantity=quantity,
+                         unit_price=unit_price, price=price)
+                    for menuitem_id, (quantity, unit_price, price) in cart.items()])
+        except CartBusy:
+            self._mark_dirty(user_id)
+            return 0
+        return 1
+
+
+_store = None
+
+
+def get_cart_store():
+    global _store
+    if _store is None:
+        config = settings.CART_STORE
+        _store = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _store
+
+
+def add_to_cart(user, lines):
+    return get_cart_store().add(user, lines)
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+from django.utils.module_loading import import_string
+
+from .events import InProcessBroker
+
+# Backends whose entries (and deletes) never leave the process
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    # Token revocation, role changes, menu invalidation, replica pins,
+    # idempotency keys and cart locks only reach other workers through a
+    # shared cache
+    if settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        'The default cache is local to each process, so invalidations and '
+        'locks are not seen by other workers.',
+        hint='Set REDIS_URL, or serve from a single process.',
+        id='LittleLemonAPI.W001',
+    )]
+
+
+@register()
+def check_event_broker(app_configs, **kwargs):
+    # An order change only reaches the /api/orders/events clients of the
+    # worker it happened in, and a long poll or reconnect landing on
+    # another worker can't replay what it missed
+    if getattr(settings, 'WEB_CONCURRENCY', 1) <= 1 or not issubclass(
+            import_string(settings.ORDER_EVENTS['BACKEND']), InProcessBroker):
+        return []
+    return [Warning(
+        f'ORDER_EVENTS uses the in-process broker with {settings.WEB_CONCURRENCY} '
+        'workers, so order event clients miss the changes made in other workers.',
+        hint="Set REDIS_URL, or use 'LittleLemonAPI.events.RedisBroker'.",
+        id='LittleLemonAPI.W002',
+    )]
@@ -0,0 +1,118 @@
+from django.conf import settings
+from rest_framework import fields, relations, serializers
+from rest_framework import ISO_8601
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .profiling import timer
+from .sparse import trim
+
+# Fields whose to_representation is the identity on database values
+PASSTHROUGH_FIELDS = (fields.IntegerField, fields.CharField, fields.BooleanField)
+
+_compiled = {}
+
+
+class CompiledSerializer:
+    # A flat representation function for one serializer class, generated
+    # from its fields once and applied to `.values()` rows instead of model
+    # instances. The output matches `serializer_class(instance).data`.
+
+    def __init__(self, serializer_class, fields=None):
+        self.serializer_class = serializer_class
+        self.columns = []
+        namespace = {}
+        serializer = trim(serializer_class(), fields)
+        expression = self._build(serializer, '', namespace)
+        source = f'def represent(row):\n    return {expression}\n'
+        exec(compile(source, f'<compiled {serializer_class.__name__}>', 'exec'),
+             namespace)
+        self.represent = namespace['represent']
+        self.source = source
+
+    def values(self, queryset, keep=()):
+        # Keep annotations added by filters (e.g. a search rank), and any
+        # `keep` columns, so a cursor can be built from them; represent()
+        # ignores extra keys
+        columns = dict.fromkeys([*self.columns, *keep, *queryset.query.annotations])
+        return queryset.values(*columns)
+
+    def many(self, rows):
+        represent = self.represent
+        with timer('serialize'):
+            return [represent(row) for row in rows]
+
+    def _build(self, serializer, prefix, namespace):
+        model = serializer.Meta.model
+        items = []
+        for field in serializer._readable_fields:
+            if field.source == '*' or '.' in field.source:
+                raise ValueError(
+                    f'{type(serializer).__name__}.{field.field_name}: '
+                    'only model fields can be compiled')
+            column = prefix + field.source
+
+            if isinstance(field, serializers.BaseSerializer):
+                value = self._build(field, column + '__', namespace)
+                if model._meta.get_field(field.source).null:
+                    self.columns.append(column)
+                    value = f'None if row[{column!r}] is None else {value}'
+            else:
+                self.columns.append(column)
+                value = f'row[{column!r}]'
+                if not _passthrough(field):
+                    value = f'(None if {value} is None else {_convert(field, value, namespace)})'
+            items.append(f'{field.field_name!r}: {value}')
+        return '{' + ', '.join(items) + '}'
+
+
+def _passthrough(field):
+    if isinstance(field, relations.PrimaryKeyRelatedField):
+        # .values() already yields the primary key
+        return field.pk_field is None
+    return isinstance(field, PASSTHROUGH_FIELDS)
+
+
+def _convert(field, value, namespace):
+    # Inline the common conversions; defer to the field for anything else
+    if (isinstance(field, fields.DecimalField)
+            and getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+            and not field.localize and not getattr(field, 'normalize_output', False)):
+        # Model columns come back from the database already at the
+        # field's scale, so DRF's quantize step is a no-op here
+        return f"format({value}, 'f')"
+    if (isinstance(field, fields.DateField)
+            and str(getattr(field, 'format', api_settings.DATE_FORMAT)).lower() == ISO_8601):
+        return f'{value}.isoformat()'
+    name = f'f{len(namespace)}'
+    namespace[name] = field.to_representation
+    return f'{name}({value})'
+
+
+def compile_serializer(serializer_class, fields=None):
+    # `fields` limits the output to those top-level fields (see sparse.py)
+    compiled = _compiled.get((serializer_class, fields))
+    if compiled is None:
+        compiled = _compiled[serializer_class, fields] = CompiledSerializer(
+            serializer_class, fields)
+    return compiled
+
+
+class CompiledListMixin:
+    # Serves list GETs through the compiled serializer when
+    # settings.COMPILED_SERIALIZERS is on; filters, ordering and pagination
+    # run as usual on the `.values()` queryset.
+
+    def list(self, request, *args, **kwargs):
+        if not getattr(settings, 'COMPILED_SERIALIZERS', False):
+            return super().list(request, *args, **kwargs)
+
+        fields = self.sparse_fields() if hasattr(self, 'sparse_fields') else None
+        compiled = compile_serializer(self.get_serializer_class(), fields)
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = compiled.values(queryset, self.sparse_keep(queryset) if fields else ())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(compiled.many(page))
+        return Response(compiled.many(queryset))
@@ -0,0 +1,51 @@
+import heapq
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, Count, When
+
+from .events import publish_order
+from .models import Order
+from .roles import DELIVERY_CREW
+
+# Most unassigned orders handed out per dispatch
+DISPATCH_BATCH_SIZE = 500
+
+
+def assign_deliveries(limit=DISPATCH_BATCH_SIZE):
+    # Spread the oldest open, unassigned orders over the delivery crew,
+    # each going to whoever has the fewest open orders at that point, and
+    # apply them all with one UPDATE. Returns {crew id: [order ids]}.
+    with transaction.atomic():
+        crew = list(User.objects.filter(
+            groups__name=DELIVERY_CREW).order_by('id').values_list('id', flat=True))
+        if not crew:
+            return {}
+
+        # Rows another dispatcher has locked are left for its own run
+        orders = list(Order.objects.select_for_update(skip_locked=True).filter(
+            delivery_crew__isnull=True, status=False).order_by(
+            'date', 'id').values('id', 'user', 'status', 'total', 'date')[:limit])
+        if not orders:
+            return {}
+
+        workload = dict.fromkeys(crew, 0)
+        workload.update(Order.objects.filter(
+            delivery_crew__in=crew, status=False).values_list(
+            'delivery_crew').annotate(open=Count('id')).order_by())
+        heap = [(open_orders, crew_id) for crew_id, open_orders in workload.items()]
+        heapq.heapify(heap)
+
+        assignments = {}
+        for order in orders:
+            open_orders, crew_id = heap[0]
+            order['delivery_crew'] = crew_id
+            assignments.setdefault(crew_id, []).append(order['id'])
+            heapq.heapreplace(heap, (open_orders + 1, crew_id))
+
+        Order.objects.filter(id__in=[order['id'] for order in orders]).update(
+            delivery_crew=Case(*[When(id__in=order_ids, then=crew_id)
+                                 for crew_id, order_ids in assignments.items()]))
+        for order in orders:
+            publish_order('assigned', order)
+    return assignments
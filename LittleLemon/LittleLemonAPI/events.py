@@ -0,0 +1,201 @@
+import asyncio
+import collections
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+ORDER_FIELDS = ['id', 'user', 'delivery_crew', 'status', 'total', 'date']
+
+# Seconds between keep-alive comments on an idle event stream
+ORDER_EVENTS_HEARTBEAT = getattr(settings, 'ORDER_EVENTS_HEARTBEAT', 15)
+# Longest a long poll (the fallback under WSGI) waits for an event
+ORDER_EVENTS_POLL_TIMEOUT = getattr(settings, 'ORDER_EVENTS_POLL_TIMEOUT', 10)
+
+
+class InProcessBroker:
+    # Fans events out to the subscribers of this process only. Each
+    # subscriber has a bounded queue; a client that falls that far behind
+    # loses its oldest events rather than holding memory. The last
+    # `replay_size` events are kept for clients resuming from an event id.
+
+    def __init__(self, queue_size=100, replay_size=1000):
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.replay = collections.deque(maxlen=replay_size)
+        self.last_id = 0
+        self.lock = threading.Lock()
+
+    def publish(self, event):
+        # Callable from any thread; events are delivered on each
+        # subscriber's own event loop. Ids are microsecond timestamps made
+        # unique, so they keep increasing across restarts.
+        with self.lock:
+            self.last_id = max(self.last_id + 1, time.time_ns() // 1000)
+            event = {**event, 'id': self.last_id}
+            self.replay.append(event)
+            subscribers = list(self.subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_put, queue, event)
+            except RuntimeError:
+                # The subscriber's loop has closed under it
+                pass
+
+    async def subscribe(self, timeout, since=None):
+        # Yields the events after event id `since` (a reset event if some
+        # are no longer kept), then events as they arrive, and None after
+        # `timeout` idle seconds
+        entry = (asyncio.get_running_loop(), asyncio.Queue(self.queue_size))
+        with self.lock:
+            self.subscribers.add(entry)
+            replay = list(self.replay)
+        try:
+            last = replay[-1]['id'] if replay else 0
+            if since is not None:
+                since = _int_id(since)
+                if since is None or not any(event['id'] <= since for event in replay):
+                    yield reset_event(last)
+                else:
+                    for event in replay:
+                        if event['id'] > since:
+                            yield event
+            while True:
+                try:
+                    event = await asyncio.wait_for(entry[1].get(), timeout)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                # Already replayed
+                if event['id'] > last:
+                    yield event
+        finally:
+            with self.lock:
+                self.subscribers.discard(entry)
+
+
+def _put(queue, event):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+def _int_id(event_id):
+    try:
+        return int(event_id)
+    except (TypeError, ValueError):
+        return None
+
+
+class RedisBroker:
+    # One Redis stream shared by every process, capped at about `maxlen`
+    # events, whose entry ids are the event ids; needs the optional `redis`
+    # package
+
+    def __init__(self, url, stream='orders:events', maxlen=1000):
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise ImproperlyConfigured(
+                'RedisBroker needs the redis package installed')
+        self.url = url
+        self.stream = stream
+        self.maxlen = maxlen
+        self.client = redis.Redis.from_url(url)
+        self.async_redis = redis.asyncio
+
+    def publish(self, event):
+        self.client.xadd(self.stream, {'event': json.dumps(event)},
+                         maxlen=self.maxlen, approximate=True)
+
+    async def subscribe(self, timeout, since=None):
+        client = self.async_redis.from_url(self.url)
+        try:
+            # Read on from the newest entry now, so nothing published
+            # between two reads is missed
+            newest = await client.xrevrange(self.stream, count=1)
+            last = newest[0][0].decode() if newest else '0-0'
+            if since is not None:
+                oldest = await client.xrange(self.stream, count=1)
+                since = _stream_id(since)
+                if since is None or not oldest or _stream_id(oldest[0][0].decode()) > since:
+                    yield reset_event(last)
+                else:
+                    last = '-'.join(map(str, since))
+            while True:
+                result = await client.xread({self.stream: last},
+                                            block=int(timeout * 1000), count=100)
+                if not result:
+                    yield None
+                    continue
+                for entry_id, fields in result[0][1]:
+                    last = entry_id.decode()
+                    yield {**json.loads(fields[b'event']), 'id': last}
+        finally:
+            await client.aclose()
+
+
+def _stream_id(event_id):
+    # A Redis stream entry id, '<ms>-<seq>', as a comparable tuple
+    try:
+        ms, seq = str(event_id).split('-')
+        return int(ms), int(seq)
+    except ValueError:
+        return None
+
+
+def reset_event(event_id):
+    # Tells a client resuming from an event id that events were missed:
+    # re-read /api/orders, then carry on from `event_id`
+    return {'event': 'reset', 'id': event_id, 'order': None,
+            'previous_delivery_crew': None}
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        config = settings.ORDER_EVENTS
+        _broker = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _broker
+
+
+def order_event(event, order, previous_crew=None):
+    # `order` is an Order or a dict of ORDER_FIELDS (ids for the users).
+    # Values go through DjangoJSONEncoder, as every backend must carry them
+    # as JSON.
+    if not isinstance(order, dict):
+        order = {'id': order.pk, 'user': order.user_id,
+                 'delivery_crew': order.delivery_crew_id, 'status': order.status,
+                 'total': order.total, 'date': order.date}
+    return json.loads(json.dumps({
+        'event': event,
+        'order': {field: order[field] for field in ORDER_FIELDS},
+        # So a crew member taken off an order hears about it
+        'previous_delivery_crew': previous_crew,
+    }, cls=DjangoJSONEncoder))
+
+
+def publish_order(event, order, previous_crew=None):
+    # Publish once the surrounding transaction commits
+    payload = order_event(event, order, previous_crew)
+    transaction.on_commit(lambda: get_broker().publish(payload))
+
+
+def can_see(event, user_id, role):
+    # Managers see every order, delivery crew the orders assigned to them
+    # and customers their own; everyone sees resets
+    order = event['order']
+    if role == 'manager' or order is None:
+        return True
+    if role == 'delivery_crew':
+        return user_id in (order['delivery_crew'], event['previous_delivery_crew'])
+    return order['user'] == user_id
@@ -0,0 +1,135 @@
+import csv
+import heapq
+import io
+import json
+
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import ArchivedOrderItem, MenuItem, OrderItem
+from .pagination import keyset_filter
+
+ORDER_FIELDS = ['id', 'user', 'delivery_crew', 'status', 'total', 'date']
+ITEM_FIELDS = ['menuitem', 'quantity', 'unit_price', 'price']
+
+EXPORT_CHUNK_SIZE = 1000
+
+
+def _chunks(orders, columns, chunk_size):
+    # `orders` as lists of `columns` dicts, `chunk_size` per round-trip.
+    # Chunks are walked by (date, id) so memory stays bounded on every
+    # backend, not just those with server-side cursors.
+    ordering = ('date', 'id')
+    position = None
+    while True:
+        chunk = orders.order_by(*ordering)
+        if position is not None:
+            chunk = chunk.filter(keyset_filter(ordering, position))
+        chunk = list(chunk.values(*columns)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+        position = [last['date'], last['id']]
+
+
+def iter_orders(orders, chunk_size=EXPORT_CHUNK_SIZE):
+    # Yield orders with their line items, reading `chunk_size` orders (and
+    # their lines) per round-trip
+    for chunk in _chunks(orders, ('id', 'user__username', 'delivery_crew__username',
+                                  'status', 'total', 'date'), chunk_size):
+        items = {}
+        for item in OrderItem.objects.filter(
+                order_id__in=[order['id'] for order in chunk]).values(
+                'order_id', 'menuitem__title', 'quantity', 'unit_price',
+                'price').order_by('order_id', 'id'):
+            items.setdefault(item['order_id'], []).append({
+                'menuitem': item['menuitem__title'],
+                'quantity': item['quantity'],
+                'unit_price': item['unit_price'],
+                'price': item['price'],
+            })
+
+        for order in chunk:
+            yield {
+                'id': order['id'],
+                'user': order['user__username'],
+                'delivery_crew': order['delivery_crew__username'],
+                'status': order['status'],
+                'total': order['total'],
+                'date': order['date'],
+                'items': items.get(order['id'], []),
+            }
+
+
+def iter_archived_orders(orders, chunk_size=EXPORT_CHUNK_SIZE):
+    # As iter_orders, for ArchivedOrder rows. The archive may be in another
+    # database, so usernames and menu item titles are looked up per chunk.
+    for chunk in _chunks(orders, ('id', 'user_id', 'delivery_crew_id',
+                                  'status', 'total', 'date'), chunk_size):
+        items = {}
+        lines = list(ArchivedOrderItem.objects.filter(
+            order_id__in=[order['id'] for order in chunk]).values(
+            'order_id', 'menuitem_id', 'quantity', 'unit_price',
+            'price').order_by('order_id', 'id'))
+        titles = dict(MenuItem.objects.filter(
+            id__in={line['menuitem_id'] for line in lines}).values_list('id', 'title'))
+        usernames = dict(User.objects.filter(
+            id__in={order[column] for order in chunk
+                    for column in ('user_id', 'delivery_crew_id')}).values_list(
+            'id', 'username'))
+        for line in lines:
+            items.setdefault(line['order_id'], []).append({
+                'menuitem': titles.get(line['menuitem_id']),
+                'quantity': line['quantity'],
+                'unit_price': line['unit_price'],
+                'price': line['price'],
+            })
+
+        for order in chunk:
+            yield {
+                'id': order['id'],
+                'user': usernames.get(order['user_id']),
+                'delivery_crew': usernames.get(order['delivery_crew_id']),
+                'status': order['status'],
+                'total': order['total'],
+                'date': order['date'],
+                'items': items.get(order['id'], []),
+            }
+
+
+def merge_orders(*streams):
+    # Interleave (date, id)-ordered order streams into one, e.g. hot and
+    # archived orders
+    return heapq.merge(*streams, key=lambda order: (order['date'], order['id']))
+
+
+def ndjson_lines(orders):
+    for order in orders:
+        yield json.dumps(order, cls=DjangoJSONEncoder) + '\n'
+
+
+def csv_lines(orders):
+    # One row per order line; orders without lines get a single row
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(ORDER_FIELDS + ITEM_FIELDS)
+    yield flush()
+    for order in orders:
+        head = [order[field] for field in ORDER_FIELDS]
+        for item in order['items'] or [dict.fromkeys(ITEM_FIELDS, '')]:
+            writer.writerow(head + [item[field] for field in ITEM_FIELDS])
+        yield flush()
+
+
+EXPORT_FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+    'csv': (csv_lines, 'text/csv'),
+}
@@ -0,0 +1,88 @@
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+# How long a stored response is replayed for
+IDEMPOTENCY_TTL = getattr(settings, 'IDEMPOTENCY_TTL', 24 * 60 * 60)
+# How long a duplicate waits for the first request to finish, and how long
+# that request's claim on the key lasts if its worker dies
+IDEMPOTENCY_WAIT = getattr(settings, 'IDEMPOTENCY_WAIT', 10)
+IDEMPOTENCY_LOCK_TTL = getattr(settings, 'IDEMPOTENCY_LOCK_TTL', 30)
+
+_POLL_INTERVAL = 0.05
+# Set again when a replay is rendered
+_RENDERED_HEADERS = {'content-type', 'content-length'}
+
+
+def _keys(request, key):
+    scope = hashlib.sha256(
+        f'{request.user.pk}|{request.path}|{key}'.encode()).hexdigest()
+    return f'idempotency:response:{scope}', f'idempotency:lock:{scope}'
+
+
+def _replay(stored, fingerprint):
+    if stored['fingerprint'] != fingerprint:
+        return Response(f'422 - {IDEMPOTENCY_HEADER} was used with a different request',
+                        status=422)
+    # Responses stored before headers were kept have none
+    response = Response(stored['data'], status=stored['status'],
+                        headers=stored.get('headers'))
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+class IdempotencyMixin:
+    # POSTs sent with an Idempotency-Key header run once per user, path and
+    # key. The first response is stored in the cache (bounded and expiring)
+    # and replayed for retries without running the view again. A duplicate
+    # that arrives while the first is still running waits for its response
+    # instead of racing it through checkout.
+
+    def post(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return super().post(request, *args, **kwargs)
+        if len(key) > 255:
+            return Response(f'400 - {IDEMPOTENCY_HEADER} too long', status=400)
+
+        response_key, lock_key = _keys(request, key)
+        fingerprint = hashlib.sha256(request.body).hexdigest()
+
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT
+        while not cache.add(lock_key, token, IDEMPOTENCY_LOCK_TTL):
+            stored = cache.get(response_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+            if time.monotonic() > deadline:
+                return Response('409 - A request with this key is in progress',
+                                status=409)
+            time.sleep(_POLL_INTERVAL)
+
+        try:
+            # The lock may have been free because the first request finished
+            stored = cache.get(response_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+            response = super().post(request, *args, **kwargs)
+            # Server errors may be transient, so a retry runs again
+            if response.status_code < 500:
+                # With the headers the view set (e.g. Location)
+                headers = {name: value for name, value in response.items()
+                           if name.lower() not in _RENDERED_HEADERS}
+                cache.set(response_key, {'fingerprint': fingerprint,
+                                         'status': response.status_code,
+                                         'data': response.data,
+                                         'headers': headers}, IDEMPOTENCY_TTL)
+            return response
+        finally:
+            # Only if still ours: a request outliving IDEMPOTENCY_LOCK_TTL
+            # may find the key claimed by another since
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
@@ -0,0 +1,169 @@
+import codecs
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+from rest_framework import fields
+from rest_framework.exceptions import ParseError, ValidationError
+
+from .caching import bump_menu_version
+from .models import Category, MenuItem
+from .upserts import bulk_upsert_add
+
+IMPORT_BATCH_SIZE = 1000
+JSON_CHUNK_SIZE = 64 * 1024
+
+# Validate each column with the field MenuItemSerializer would use, without
+# building a serializer per row
+ROW_FIELDS = {
+    'title': fields.CharField(max_length=255),
+    'price': fields.DecimalField(max_digits=6, decimal_places=2),
+    'featured': fields.BooleanField(required=False, default=False),
+    'Category_id': fields.IntegerField(),
+}
+
+
+def csv_rows(stream):
+    # Rows of a CSV upload with a header line, decoded line by line
+    reader = csv.DictReader(codecs.iterdecode(stream or [], 'utf-8-sig'))
+    try:
+        for row in reader:
+            # Blank cells count as missing, so optional columns can be left
+            # empty; cells past the header are ignored
+            yield {key: value for key, value in row.items()
+                   if key is not None and value not in ('', None)}
+    except (csv.Error, UnicodeDecodeError) as exc:
+        raise ParseError(f'CSV parse error - {exc}')
+
+
+def json_rows(stream, chunk_size=JSON_CHUNK_SIZE):
+    # Elements of a JSON array upload, decoded one at a time from a rolling
+    # buffer so the whole document is never held in memory
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer, pos, eof = '', 0, False
+    # Where in the array we are: before its '[', before its first element,
+    # after an element, or after a ',' (an element must follow)
+    state = 'start'
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+        if pos < len(buffer):
+            char = buffer[pos]
+            if state == 'start':
+                if char != '[':
+                    raise ParseError('JSON parse error - expected an array of menu items')
+                state = 'first'
+                pos += 1
+                continue
+            if state == 'element':
+                if char == ']':
+                    return
+                if char != ',':
+                    raise ParseError("JSON parse error - expected ',' or ']' "
+                                     'after an array element')
+                state = 'comma'
+                pos += 1
+                continue
+            if char == ']' and state == 'first':
+                return
+            if char in ',]':
+                raise ParseError(f"JSON parse error - unexpected '{char}' in array")
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as exc:
+                if eof:
+                    raise ParseError(f'JSON parse error - {exc}')
+            else:
+                # A scalar that runs to the end of the buffer may be cut short
+                if end < len(buffer) or eof:
+                    yield value
+                    buffer, pos = buffer[end:], 0
+                    state = 'element'
+                    continue
+        elif eof:
+            raise ParseError('JSON parse error - unexpected end of input')
+
+        try:
+            chunk = stream.read(chunk_size) if stream is not None else b''
+            buffer = buffer[pos:] + text.decode(chunk, final=not chunk)
+        except UnicodeDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+        pos, eof = 0, not chunk
+
+
+IMPORT_FORMATS = {
+    'csv': csv_rows,
+    'json': json_rows,
+}
+
+
+def validate_row(row, categories):
+    # Returns (values, errors) for one uploaded row
+    if not isinstance(row, dict):
+        return None, {'non_field_errors': ['Expected an object.']}
+    values, errors = {}, {}
+    for name, field in ROW_FIELDS.items():
+        try:
+            values[name] = field.run_validation(row.get(name, fields.empty))
+        except ValidationError as exc:
+            errors[name] = exc.detail
+    if 'Category_id' in values and values['Category_id'] not in categories:
+        errors['Category_id'] = [f'Invalid pk "{values["Category_id"]}" - '
+                                 'object does not exist.']
+    return values, errors
+
+
+def import_menu_items(rows, batch_size=IMPORT_BATCH_SIZE):
+    # Create or update menu items by title from an iterable of uploaded rows,
+    # in one transaction. Invalid rows are skipped and reported by their
+    # 1-based position; everything else is written in batches of one
+    # lookup, one insert and one upsert.
+    categories = set(Category.objects.values_list('id', flat=True))
+    result = {'created': 0, 'updated': 0, 'errors': []}
+    numbered = enumerate(rows, start=1)
+
+    with transaction.atomic():
+        while batch := list(islice(numbered, batch_size)):
+            items = {}
+            for number, row in batch:
+                values, errors = validate_row(row, categories)
+                if errors:
+                    result['errors'].append({'row': number, 'errors': errors})
+                else:
+                    # A later row for the same title wins
+                    items[values['title']] = values
+            if items:
+                _write_batch(items, result)
+        transaction.on_commit(bump_menu_version)
+    return result
+
+
+def _write_batch(items, result):
+    existing = {}
+    for pk, title in MenuItem.objects.filter(
+            title__in=list(items)).order_by('-id').values_list('id', 'title'):
+        # Where titles are duplicated, update the oldest item
+        existing[title] = pk
+
+    created, updated = [], []
+    for title, values in items.items():
+        if title in existing:
+            updated.append({'id': existing[title], 'title': title,
+                            'price': values['price'], 'featured': values['featured'],
+                            'Category': values['Category_id']})
+        else:
+            created.append(MenuItem(title=title, price=values['price'],
+                                    featured=values['featured'],
+                                    Category_id=values['Category_id']))
+
+    MenuItem.objects.bulk_create(created)
+    # One upsert on the primary key instead of bulk_update's CASE WHEN per
+    # column, which grows with the batch. bulk_create(update_conflicts=True)
+    # can't name the conflict target on MySQL.
+    bulk_upsert_add(MenuItem, updated, unique_fields=['id'], add_fields=(),
+                    set_fields=['price', 'featured', 'Category'])
+    result['created'] += len(created)
+    result['updated'] += len(updated)
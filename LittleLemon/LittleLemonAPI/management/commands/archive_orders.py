@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.archive import ARCHIVE_BATCH_SIZE, ORDER_ARCHIVE_DAYS, archive_orders
+
+
+class Command(BaseCommand):
+    help = ('Move delivered orders older than --days, with their lines, to the '
+            'archive tables in resumable batches. Archived orders are left out '
+            'of /api/orders and /api/orders/export unless ?archived=1 is passed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=ORDER_ARCHIVE_DAYS)
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        total = 0
+        for moved in archive_orders(options['days'], options['batch_size']):
+            total += moved
+            self.stdout.write(f'{total} orders archived...')
+        self.stdout.write(self.style.SUCCESS(f'{total} orders archived.'))
@@ -0,0 +1,62 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from LittleLemonAPI.compiled import compile_serializer
+from LittleLemonAPI.models import Cart, Category, MenuItem, Order
+from LittleLemonAPI.serializers import (AdminOrderSerializer, CartSerializer,
+                                        CategorySerializer, MenuItemSerializer)
+
+TARGETS = [
+    (CategorySerializer, Category.objects.all()),
+    (MenuItemSerializer, MenuItem.objects.select_related('Category')),
+    (CartSerializer, Cart.objects.all()),
+    (AdminOrderSerializer, Order.objects.all()),
+]
+
+
+def best_of(repeat, func):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+class Command(BaseCommand):
+    help = ('Time DRF serializers against their compiled form on one large '
+            'page (query + serialize + JSON render) and check the rendered '
+            'bytes match. Seed the database with seed_data first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        renderer = JSONRenderer()
+        report = {'rows': options['rows'], 'serializers': {}}
+
+        for serializer_class, queryset in TARGETS:
+            queryset = queryset.order_by('pk')[:options['rows']]
+            compiled = compile_serializer(serializer_class)
+
+            drf_time, drf_bytes = best_of(options['repeat'], lambda: renderer.render(
+                serializer_class(list(queryset), many=True).data))
+            fast_time, fast_bytes = best_of(options['repeat'], lambda: renderer.render(
+                compiled.many(compiled.values(queryset))))
+
+            if drf_bytes != fast_bytes:
+                raise CommandError(
+                    f'{serializer_class.__name__}: compiled output differs')
+            report['serializers'][serializer_class.__name__] = {
+                'rows': queryset.count(),
+                'drf_ms': round(drf_time * 1000, 2),
+                'compiled_ms': round(fast_time * 1000, 2),
+                'speedup': round(drf_time / fast_time, 2) if fast_time else None,
+            }
+
+        self.stdout.write(json.dumps(report, indent=2))
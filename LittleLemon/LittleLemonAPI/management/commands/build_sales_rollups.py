@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from LittleLemonAPI.rollups import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the daily sales rollups from Order and OrderItem, and '
+            'the archived orders, for all history or a date range.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', help='First day, YYYY-MM-DD.')
+        parser.add_argument('--to', dest='end', help='Last day, YYYY-MM-DD.')
+
+    def handle(self, *args, **options):
+        dates = {}
+        for name in ('start', 'end'):
+            if options[name]:
+                try:
+                    dates[name] = parse_date(options[name])
+                except ValueError:
+                    dates[name] = None
+                if dates[name] is None:
+                    raise CommandError(f'Bad date: {options[name]}')
+        rebuild_sales_rollups(**dates)
+        self.stdout.write(self.style.SUCCESS('Sales rollups rebuilt.'))
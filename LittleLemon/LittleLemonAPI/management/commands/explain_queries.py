@@ -0,0 +1,158 @@
+import json
+import random
+import re
+from urllib.parse import parse_qs, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.settings import api_settings
+
+from LittleLemonAPI.caching import bump_menu_version
+from .load_test import Context, throttling_disabled
+
+# Read requests whose queries are checked, as (role, path)
+ENDPOINTS = [
+    (None, '/api/category'),
+    (None, '/api/menu-items'),
+    (None, '/api/menu-items?ordering=price'),
+    (None, '/api/menu-items?ordering=-title'),
+    (None, '/api/menu-items?Category={category}'),
+    (None, '/api/menu-items?search=Dish'),
+    (None, '/api/menu-items?search=Dish&ordering=price'),
+    ('customer', '/api/menu-items/{menuitem}'),
+    ('customer', '/api/cart/menu-items'),
+    ('customer', '/api/orders'),
+    ('delivery_crew', '/api/orders'),
+    ('manager', '/api/orders'),
+    ('manager', '/api/orders?ordering=date'),
+    ('manager', '/api/orders/{order}'),
+    ('manager', '/api/orders/export?from=2000-01-01&status=0'),
+    ('manager', '/api/groups/delivery-crew/users'),
+]
+
+# Plan lines that mean a full table scan or a sort the index can't serve
+PLAN_WARNINGS = {
+    'sqlite': [
+        ('full scan', re.compile(r'\bSCAN (?!.*\b(USING|VIRTUAL TABLE INDEX)\b)')),
+        ('filesort', re.compile(r'USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT)')),
+    ],
+    'postgresql': [
+        ('full scan', re.compile(r'Seq Scan on ')),
+        ('filesort', re.compile(r'\bSort\b(?! Key)')),
+    ],
+    'mysql': [
+        ('full scan', re.compile(r'\bALL\b')),
+        ('filesort', re.compile(r'Using filesort')),
+    ],
+}
+
+# Tables too small to be worth an index, and reads that are full by design
+ALLOWED_SCANS = {'LittleLemonAPI_category', 'auth_group', 'django_session',
+                 'sqlite_master'}
+
+
+def rank_ordered(path):
+    # Searches are listed by relevance unless the request picks an ordering
+    # (see MenuItemPagination)
+    params = parse_qs(urlsplit(path).query)
+    return (api_settings.SEARCH_PARAM in params
+            and api_settings.ORDERING_PARAM not in params)
+
+
+class Command(BaseCommand):
+    help = ('Request every read endpoint in-process, run each query it '
+            'issues through EXPLAIN and flag full scans and filesorts. '
+            'Exits non-zero when something is flagged. Seed the database '
+            'with seed_data first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='localhost',
+                            help='Host header to send; must be in ALLOWED_HOSTS.')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the full report as JSON.')
+        parser.add_argument('--warn-only', action='store_true',
+                            help='Report problems without failing.')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in PLAN_WARNINGS:
+            raise CommandError(f'No plan checks for {connection.vendor}')
+
+        ctx = Context(random.Random(0))
+        client = Client(headers={'host': options['host']},
+                        raise_request_exception=False)
+        values = {'category': ctx.categories[0], 'menuitem': ctx.menu_items[0],
+                  'order': ctx.orders[0]}
+
+        report, flagged = [], 0
+        with throttling_disabled():
+            for role, path in ENDPOINTS:
+                path = path.format(**values)
+                headers = {'Authorization': f'Token {ctx.tokens[role]}'} if role else {}
+                # Make the menu read cache miss so the real queries run
+                bump_menu_version()
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(path, headers=headers)
+                    if response.streaming:
+                        for _ in response.streaming_content:
+                            pass
+
+                entry = {'role': role, 'path': path,
+                         'status': response.status_code, 'queries': []}
+                ranked = rank_ordered(path)
+                for sql in dict.fromkeys(q['sql'] for q in queries.captured_queries):
+                    if not sql.lstrip().upper().startswith('SELECT'):
+                        continue
+                    plan = self.explain(sql)
+                    warnings = self.check_plan(sql, plan, ranked)
+                    flagged += len(warnings)
+                    entry['queries'].append(
+                        {'sql': sql, 'plan': plan, 'warnings': warnings})
+                report.append(entry)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+
+        if flagged and not options['warn_only']:
+            raise CommandError(f'{flagged} query plan problem(s) found')
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(connection.ops.explain_query_prefix() + ' ' + sql)
+            rows = cursor.fetchall()
+        return ['\t'.join(str(column) for column in row) for row in rows]
+
+    def check_plan(self, sql, plan, ranked=False):
+        # An unfiltered, LIMITed scan with no sort is an index-order walk
+        # that stops after one page
+        bounded = ' LIMIT ' in sql and ' WHERE ' not in sql
+        # A search listed best match first has to sort its matches by
+        # relevance; any other ordering of them should be served by an index
+        ranked = ranked and ' MATCH ' in sql
+        warnings = []
+        for line in plan:
+            for problem, pattern in PLAN_WARNINGS[connection.vendor]:
+                match = pattern.search(line)
+                if (not match or (bounded and problem == 'full scan')
+                        or (ranked and problem == 'filesort')):
+                    continue
+                if any(table in line for table in ALLOWED_SCANS):
+                    continue
+                warnings.append(f'{problem}: {line.strip()}')
+        return warnings
+
+    def print_report(self, report):
+        for entry in report:
+            problems = [w for q in entry['queries'] for w in q['warnings']]
+            style = self.style.ERROR if problems else self.style.SUCCESS
+            self.stdout.write(style(
+                f'{"FLAG" if problems else "ok  "} {entry["role"] or "anon"} '
+                f'GET {entry["path"]} ({entry["status"]}, '
+                f'{len(entry["queries"])} selects)'))
+            for query in entry['queries']:
+                for warning in query['warnings']:
+                    self.stdout.write(f'       {warning}')
+                    self.stdout.write(f'       in: {query["sql"][:200]}')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.carts import get_cart_store
+
+
+class Command(BaseCommand):
+    help = ('Write carts changed since the last run from the cache to Cart '
+            'rows, when CART_STORE is the CacheCartStore. Run periodically '
+            'for durability.')
+
+    def handle(self, *args, **options):
+        flushed = get_cart_store().flush()
+        self.stdout.write(self.style.SUCCESS(f'{flushed} carts flushed.'))
@@ -0,0 +1,354 @@
+import json
+import math
+import random
+import re
+import time
+from contextlib import contextmanager, nullcontext
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.throttling import SimpleRateThrottle
+
+from LittleLemonAPI.models import Category, MenuItem, Order
+from LittleLemonAPI.roles import DELIVERY_CREW, MANAGER
+
+
+# GETs that have an async twin under /api/async/ (see async_views.py)
+ASYNC_READ_PATHS = re.compile(
+    r'^/api/(category|menu-items(/\d+)?|cart/menu-items|orders)(\?|$)')
+
+
+# Each scenario is a generator of (name, role, method, path, data) requests.
+# It is sent the response of each request, so later steps can build on
+# earlier ones. Write scenarios undo their own changes where they can, so
+# repeated runs see the same data.
+
+def browse_categories(ctx):
+    query = ctx.rng.choice(['', '?fields=title'])
+    yield 'GET /category', None, 'get', '/api/category' + query, None
+
+
+def browse_menu(ctx):
+    query = ctx.rng.choice([
+        '', '?ordering=price', '?ordering=-title', '?search=Dish 1',
+        f'?Category={ctx.rng.choice(ctx.categories)}',
+        '?fields=title,price', '?fields=title&ordering=price'])
+    yield 'GET /menu-items', None, 'get', '/api/menu-items' + query, None
+
+
+def view_menu_item(ctx):
+    pk = ctx.rng.choice(ctx.menu_items)
+    yield 'GET /menu-items/<pk>', 'customer', 'get', f'/api/menu-items/{pk}', None
+
+
+def edit_menu_item(ctx):
+    pk = ctx.rng.choice(ctx.menu_items)
+    yield ('PATCH /menu-items/<pk>', 'manager', 'patch', f'/api/menu-items/{pk}',
+           {'featured': ctx.rng.random() < 0.1})
+
+
+def import_menu(ctx):
+    # Re-imports existing items as they are, so only updates are written
+    pks = ctx.rng.sample(ctx.menu_items, min(20, len(ctx.menu_items)))
+    rows = list(MenuItem.objects.filter(pk__in=pks).values(
+        'title', 'price', 'featured', 'Category_id'))
+    yield 'POST /menu-items/import', 'admin', 'post', '/api/menu-items/import', rows
+
+
+def manage_group(group, path):
+    def scenario(ctx):
+        yield f'GET {path}', 'admin', 'get', f'/api{path}', None
+        username = ctx.users['customer'].username
+        yield f'POST {path}', 'admin', 'post', f'/api{path}', {'username': username}
+        yield (f'DELETE {path}/<pk>', 'admin', 'delete',
+               f'/api{path}/{ctx.users["customer"].pk}', None)
+    scenario.__name__ = f'manage_{group}'
+    return scenario
+
+
+def view_cart(ctx):
+    yield 'GET /cart/menu-items', 'customer', 'get', '/api/cart/menu-items', None
+
+
+def checkout(ctx):
+    yield 'DELETE /cart/menu-items', 'customer', 'delete', '/api/cart/menu-items', None
+    for pk in ctx.rng.sample(ctx.menu_items, min(3, len(ctx.menu_items))):
+        yield ('POST /cart/menu-items', 'customer', 'post', '/api/cart/menu-items',
+               {'menuitem': pk, 'quantity': ctx.rng.randint(1, 4)})
+    yield 'POST /orders', 'customer', 'post', '/api/orders', {}
+
+
+def fill_cart(ctx):
+    yield 'DELETE /cart/menu-items', 'customer', 'delete', '/api/cart/menu-items', None
+    yield ('POST /cart/menu-items/batch', 'customer', 'post', '/api/cart/menu-items/batch',
+           [{'menuitem': pk, 'quantity': ctx.rng.randint(1, 4)}
+            for pk in ctx.rng.sample(ctx.menu_items, min(5, len(ctx.menu_items)))])
+    yield 'DELETE /cart/menu-items', 'customer', 'delete', '/api/cart/menu-items', None
+
+
+def list_orders(ctx):
+    role = ctx.rng.choice(['manager', 'delivery_crew', 'customer'])
+    query = ctx.rng.choice(['', '', '?fields=id,total'])
+    yield 'GET /orders', role, 'get', '/api/orders' + query, None
+
+
+def view_order(ctx):
+    pk = ctx.rng.choice(ctx.orders)
+    yield 'GET /orders/<pk>', 'manager', 'get', f'/api/orders/{pk}', None
+
+
+def dispatch_order(ctx):
+    # A manager places an order, assigns it, then removes it again
+    pk = ctx.rng.choice(ctx.menu_items)
+    yield ('POST /cart/menu-items', 'manager', 'post', '/api/cart/menu-items',
+           {'menuitem': pk, 'quantity': 1})
+    response = yield 'POST /orders', 'manager', 'post', '/api/orders', {}
+    if response.status_code != 201:
+        return
+    order = json.loads(response.content)['id']
+    yield ('PATCH /orders/<pk>', 'manager', 'patch', f'/api/orders/{order}',
+           {'delivery_crew': ctx.users['delivery_crew'].pk})
+    yield 'DELETE /orders/<pk>', 'manager', 'delete', f'/api/orders/{order}', None
+
+
+def assign_orders(ctx):
+    # Assigns a few open orders, then hands them back
+    response = yield ('POST /orders/assign', 'manager', 'post', '/api/orders/assign',
+                      {'limit': 5})
+    if response.status_code != 200:
+        return
+    for member in json.loads(response.content)['details']:
+        for order in member['orders']:
+            yield ('PATCH /orders/<pk>', 'manager', 'patch', f'/api/orders/{order}',
+                   {'delivery_crew': None})
+
+
+def export_orders(ctx):
+    yield ('GET /orders/export', 'manager', 'get',
+           '/api/orders/export?type=ndjson&status=0', None)
+
+
+def sales_analytics(ctx):
+    query = ctx.rng.choice(['', '?top=5', '?from=2000-01-01'])
+    yield 'GET /analytics/sales', 'manager', 'get', '/api/analytics/sales' + query, None
+
+
+def order_events(ctx):
+    # An immediate long poll under WSGI; under ASGI only the stream's
+    # opening comment is read (see consume)
+    role = ctx.rng.choice(['manager', 'delivery_crew', 'customer'])
+    yield 'GET /orders/events', role, 'get', '/api/orders/events?timeout=0', None
+
+
+def async_reads(ctx):
+    # The async views, whether or not --async-reads sends the others there
+    reader = ctx.rng.choice(['manager', 'delivery_crew', 'customer'])
+    name, role, path = ctx.rng.choice([
+        ('GET /async/category', None, '/api/async/category'),
+        ('GET /async/menu-items', None, '/api/async/menu-items?fields=title,price'),
+        ('GET /async/menu-items/<pk>', 'customer',
+         f'/api/async/menu-items/{ctx.rng.choice(ctx.menu_items)}'),
+        ('GET /async/cart/menu-items', 'customer', '/api/async/cart/menu-items'),
+        ('GET /async/orders', reader, '/api/async/orders'),
+    ])
+    yield name, role, 'get', path, None
+
+
+WORKLOAD = [
+    (browse_categories, 10),
+    (browse_menu, 25),
+    (view_menu_item, 15),
+    (edit_menu_item, 1),
+    (import_menu, 1),
+    (manage_group('manager', '/groups/manager/users'), 1),
+    (manage_group('crew', '/groups/delivery-crew/users'), 1),
+    (view_cart, 10),
+    (checkout, 4),
+    (fill_cart, 3),
+    (list_orders, 15),
+    (view_order, 5),
+    (dispatch_order, 2),
+    (assign_orders, 1),
+    (export_orders, 1),
+    (sales_analytics, 2),
+    (order_events, 2),
+    (async_reads, 5),
+]
+
+
+class Context:
+    def __init__(self, rng):
+        self.rng = rng
+        self.categories = list(Category.objects.values_list('pk', flat=True)[:1000])
+        self.menu_items = list(MenuItem.objects.values_list('pk', flat=True)[:1000])
+        self.orders = list(Order.objects.values_list('pk', flat=True)[:1000])
+        self.users = {
+            'admin': User.objects.filter(is_superuser=True).first(),
+            'manager': User.objects.filter(groups__name=MANAGER).first(),
+            'delivery_crew': User.objects.filter(groups__name=DELIVERY_CREW).first(),
+            'customer': User.objects.filter(is_superuser=False, groups=None).first(),
+        }
+        missing = [role for role, user in self.users.items() if user is None]
+        if missing or not (self.categories and self.menu_items and self.orders):
+            raise CommandError(
+                'Not enough data to drive the workload (missing: %s). Create a '
+                'superuser and run seed_data first.'
+                % ', '.join(missing or ['menu items/orders']))
+        self.tokens = {role: Token.objects.get_or_create(user=user)[0].key
+                       for role, user in self.users.items()}
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+@contextmanager
+def throttling_disabled():
+    # A rate of None makes SimpleRateThrottle allow every request
+    rates = SimpleRateThrottle.THROTTLE_RATES
+    SimpleRateThrottle.THROTTLE_RATES = {scope: None for scope in rates}
+    try:
+        yield
+    finally:
+        SimpleRateThrottle.THROTTLE_RATES = rates
+
+
+class Command(BaseCommand):
+    help = ('Replay a deterministic mixed workload against every '
+            'LittleLemonAPI route through the WSGI or ASGI handler '
+            'in-process and report a JSON baseline. Runs against the '
+            'configured database; seed it with seed_data first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--interface', choices=['wsgi', 'asgi'], default='wsgi')
+        parser.add_argument('--host', default='localhost',
+                            help='Host header to send under WSGI; must be in '
+                                 'ALLOWED_HOSTS.')
+        parser.add_argument('--async-reads', action='store_true',
+                            help='Send the hot GETs to their async views.')
+        parser.add_argument('--throttle', action='store_true',
+                            help='Keep API throttling on (off by default).')
+        parser.add_argument('--output', help='Write the JSON report here.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        ctx = Context(rng)
+        send = self.make_sender(options['interface'], options['host'],
+                                options['async_reads'])
+        scenarios = [scenario for scenario, _ in WORKLOAD]
+        weights = [weight for _, weight in WORKLOAD]
+
+        # AsyncClient always sends Host: testserver, whatever --host says
+        hosts = (override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'])
+                 if options['interface'] == 'asgi' else nullcontext())
+
+        samples = {}
+        started = time.perf_counter()
+        with hosts, nullcontext() if options['throttle'] else throttling_disabled():
+            done = 0
+            while done < options['requests']:
+                scenario = rng.choices(scenarios, weights)[0](ctx)
+                response = None
+                while done < options['requests']:
+                    try:
+                        name, role, method, path, data = scenario.send(response)
+                    except StopIteration:
+                        break
+                    response, elapsed, queries = send(
+                        method, path, data, ctx.tokens.get(role))
+                    samples.setdefault(name, []).append(
+                        (elapsed, queries, response.status_code))
+                    done += 1
+        wall = time.perf_counter() - started
+
+        report = {
+            'interface': options['interface'],
+            'async_reads': options['async_reads'],
+            'seed': options['seed'],
+            'requests': done,
+            'wall_seconds': round(wall, 3),
+            'throughput_rps': round(done / wall, 1) if wall else None,
+            'endpoints': {name: summarise(rows) for name, rows in sorted(samples.items())},
+            'overall': summarise([row for rows in samples.values() for row in rows]),
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+    def make_sender(self, interface, host, async_reads):
+        if interface == 'asgi':
+            client = AsyncClient(raise_request_exception=False)
+        else:
+            client = Client(headers={'host': host}, raise_request_exception=False)
+
+        def send(method, path, data, token):
+            if async_reads and method == 'get' and ASYNC_READ_PATHS.match(path):
+                path = '/api/async/' + path[len('/api/'):]
+            headers = {'Authorization': f'Token {token}'} if token else {}
+            kwargs = {'headers': headers}
+            if data is not None:
+                kwargs.update(data=data, content_type='application/json')
+            request = getattr(client, method)
+            # CaptureQueriesContext sees the ORM work because sync views run
+            # on this thread under both handlers
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                if interface == 'asgi':
+                    response = async_to_sync(request)(path, **kwargs)
+                else:
+                    response = request(path, **kwargs)
+                if response.streaming:
+                    consume(response)
+                elapsed = time.perf_counter() - start
+            return response, elapsed, len(queries)
+        return send
+
+
+def consume(response):
+    # An event stream never ends; read its first chunk only
+    endless = response.get('Content-Type', '').startswith('text/event-stream')
+    if response.is_async:
+        async def drain():
+            chunks = aiter(response.streaming_content)
+            try:
+                async for _ in chunks:
+                    if endless:
+                        break
+            finally:
+                if hasattr(chunks, 'aclose'):
+                    await chunks.aclose()
+        async_to_sync(drain)()
+    else:
+        for _ in response.streaming_content:
+            if endless:
+                break
+
+
+def summarise(rows):
+    latencies = sorted(elapsed * 1000 for elapsed, _, _ in rows)
+    busy = sum(latencies) / 1000
+    return {
+        'requests': len(rows),
+        'errors': sum(1 for _, _, status in rows if status >= 500),
+        'client_errors': sum(1 for _, _, status in rows if 400 <= status < 500),
+        'throughput_rps': round(len(rows) / busy, 1) if busy else None,
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'queries_per_request': round(
+            sum(queries for _, queries, _ in rows) / len(rows), 2),
+    }
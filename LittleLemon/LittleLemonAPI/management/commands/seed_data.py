@@ -0,0 +1,164 @@
+import datetime
+import random
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from LittleLemonAPI.caching import bump_menu_version
+from LittleLemonAPI.models import Cart, Category, MenuItem, Order, OrderItem
+from LittleLemonAPI.roles import DELIVERY_CREW, MANAGER
+from LittleLemonAPI.rollups import rebuild_sales_rollups
+
+
+def _next_id(model):
+    return (model.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+
+
+def _batched(objects, size):
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Deterministically seed categories, menu items, users, carts and '
+            'orders with bulk inserts, for load testing.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--menu-items', type=int, default=200)
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--managers', type=int, default=5)
+        parser.add_argument('--delivery-crew', type=int, default=50)
+        parser.add_argument('--carts', type=int, default=200,
+                            help='Number of customers with a filled cart.')
+        parser.add_argument('--orders', type=int, default=10000)
+        parser.add_argument('--max-lines', type=int, default=5,
+                            help='Maximum lines per cart and per order.')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Spread order dates over this many past days.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        # Every seeded user shares one hash; hashing per user would dominate
+        self.password = make_password('littlelemon')
+        # Ids are assigned up front so rows can reference each other without
+        # reading generated keys back, which not every backend supports
+        self.prefix = f'seed{options["seed"]}-{_next_id(User)}'
+
+        with transaction.atomic():
+            categories = self.seed_categories(options['categories'])
+            menu = self.seed_menu_items(options['menu_items'], categories)
+            customers = self.seed_users('customer', options['customers'])
+            managers = self.seed_users('manager', options['managers'], MANAGER)
+            crew = self.seed_users('crew', options['delivery_crew'], DELIVERY_CREW)
+            self.seed_carts(customers[:options['carts']], menu,
+                            options['max_lines'])
+            self.seed_orders(options['orders'], customers, crew, menu,
+                             options['max_lines'], options['days'])
+            self.reset_sequences()
+            rebuild_sales_rollups()
+        # bulk_create skips the signals that normally invalidate menu reads
+        bump_menu_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(categories)} categories, {len(menu)} menu items, '
+            f'{len(customers)} customers, {len(managers)} managers, '
+            f'{len(crew)} delivery crew, {min(options["carts"], len(customers))} '
+            f'carts and {options["orders"]} orders.'))
+
+    def reset_sequences(self):
+        # Explicit ids don't advance sequences on backends that have them
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [Category, MenuItem, User, Order])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def bulk(self, model, objects):
+        for batch in _batched(objects, self.batch_size):
+            model.objects.bulk_create(batch)
+
+    def seed_categories(self, count):
+        start = _next_id(Category)
+        ids = list(range(start, start + count))
+        self.bulk(Category, (
+            Category(id=pk, slug=f'{self.prefix}-category-{pk}',
+                     title=f'Category {pk}')
+            for pk in ids))
+        return ids
+
+    def seed_menu_items(self, count, categories):
+        start = _next_id(MenuItem)
+        prices = {}
+        for pk in range(start, start + count):
+            prices[pk] = Decimal(self.rng.randint(200, 4000)) / 100
+        self.bulk(MenuItem, (
+            MenuItem(id=pk, title=f'Dish {pk}', price=price,
+                     featured=self.rng.random() < 0.1,
+                     Category_id=self.rng.choice(categories))
+            for pk, price in prices.items()))
+        return list(prices.items())
+
+    def seed_users(self, role, count, group=None):
+        start = _next_id(User)
+        ids = list(range(start, start + count))
+        self.bulk(User, (
+            User(id=pk, username=f'{self.prefix}-{role}-{pk}',
+                 email=f'{role}{pk}@example.com', password=self.password)
+            for pk in ids))
+        if group:
+            group = Group.objects.get_or_create(name=group)[0]
+            Membership = User.groups.through
+            self.bulk(Membership, (
+                Membership(user_id=pk, group_id=group.id) for pk in ids))
+        return ids
+
+    def seed_carts(self, users, menu, max_lines):
+        def rows():
+            for user_id in users:
+                lines = self.rng.sample(menu, self.rng.randint(1, min(max_lines, len(menu))))
+                for menuitem_id, unit_price in lines:
+                    quantity = self.rng.randint(1, 4)
+                    yield Cart(user_id=user_id, menuitem_id=menuitem_id,
+                               quantity=quantity, unit_price=unit_price,
+                               price=unit_price * quantity)
+        self.bulk(Cart, rows())
+
+    def seed_orders(self, count, customers, crew, menu, max_lines, days):
+        today = datetime.date.today()
+        start = _next_id(Order)
+        for batch_start in range(start, start + count, self.batch_size):
+            orders, items = [], []
+            for pk in range(batch_start, min(batch_start + self.batch_size, start + count)):
+                total = Decimal(0)
+                lines = self.rng.sample(menu, self.rng.randint(1, min(max_lines, len(menu))))
+                for menuitem_id, unit_price in lines:
+                    quantity = self.rng.randint(1, 4)
+                    price = unit_price * quantity
+                    total += price
+                    items.append(OrderItem(
+                        order_id=pk, menuitem_id=menuitem_id,
+                        quantity=quantity, unit_price=unit_price, price=price))
+                assigned = crew and self.rng.random() < 0.7
+                orders.append(Order(
+                    id=pk, user_id=self.rng.choice(customers),
+                    delivery_crew_id=self.rng.choice(crew) if assigned else None,
+                    status=assigned and self.rng.random() < 0.8,
+                    total=total,
+                    date=today - datetime.timedelta(days=self.rng.randrange(days))))
+            Order.objects.bulk_create(orders)
+            OrderItem.objects.bulk_create(items, batch_size=self.batch_size)
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_items_to_orders(apps, schema_editor):
+    # OrderItem.order used to point at the ordering user. Re-point each
+    # user's items at their most recent order, dropping items of users
+    # that never placed one.
+    Order = apps.get_model('LittleLemonAPI', 'Order')
+    OrderItem = apps.get_model('LittleLemonAPI', 'OrderItem')
+    user_ids = OrderItem.objects.values_list('order', flat=True).distinct()
+    for user_id in list(user_ids):
+        order = Order.objects.filter(user_id=user_id).order_by(
+            '-date', '-id').first()
+        items = OrderItem.objects.filter(order=user_id)
+        if order is None:
+            items.delete()
+        else:
+            items.update(order=order.id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0001_initial'),
+    ]
+
+    operations = [
+        # Drop the constraint to auth_user first so the ids can be rewritten
+        migrations.AlterField(
+            model_name='orderitem',
+            name='order',
+            field=models.BigIntegerField(db_column='order_id'),
+        ),
+        migrations.RunPython(link_items_to_orders, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='order',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='LittleLemonAPI.order'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# FTS5 index over MenuItem.title and the triggers that keep it in step (see
+# search.py). The SQL is frozen here as of this migration; search.py keeps
+# the current copy, which it reinstalls after every migrate. FTS5 is
+# SQLite only: on other backends, and on SQLite builds without it, nothing
+# is created and searches fall back to DRF's icontains SearchFilter.
+
+CREATE_TABLE = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS menuitem_search USING fts5(
+        title, content="LittleLemonAPI_menuitem", content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')'''
+
+CREATE_TRIGGERS = [
+    '''CREATE TRIGGER IF NOT EXISTS menuitem_search_ai
+       AFTER INSERT ON "LittleLemonAPI_menuitem" BEGIN
+           INSERT INTO menuitem_search (rowid, title) VALUES (new.id, new.title);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS menuitem_search_ad
+       AFTER DELETE ON "LittleLemonAPI_menuitem" BEGIN
+           INSERT INTO menuitem_search (menuitem_search, rowid, title)
+           VALUES ('delete', old.id, old.title);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS menuitem_search_au
+       AFTER UPDATE OF title ON "LittleLemonAPI_menuitem" BEGIN
+           INSERT INTO menuitem_search (menuitem_search, rowid, title)
+           VALUES ('delete', old.id, old.title);
+           INSERT INTO menuitem_search (rowid, title) VALUES (new.id, new.title);
+       END''',
+]
+
+REBUILD = "INSERT INTO menuitem_search (menuitem_search) VALUES ('rebuild')"
+
+DROP = [
+    'DROP TRIGGER IF EXISTS menuitem_search_ai',
+    'DROP TRIGGER IF EXISTS menuitem_search_ad',
+    'DROP TRIGGER IF EXISTS menuitem_search_au',
+    'DROP TABLE IF EXISTS menuitem_search',
+]
+
+
+def install(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(CREATE_TABLE)
+        except OperationalError:
+            # SQLite built without FTS5
+            return
+        for sql in CREATE_TRIGGERS:
+            cursor.execute(sql)
+        cursor.execute(REBUILD)
+
+
+def uninstall(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in DROP:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0004_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
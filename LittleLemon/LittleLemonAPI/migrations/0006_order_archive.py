@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0005_menuitem_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('user_id', models.IntegerField()),
+                ('delivery_crew_id', models.IntegerField(null=True)),
+                ('status', models.BooleanField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('date', models.DateField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'id'], name='archivedorder_date_idx'), models.Index(fields=['user_id', 'date', 'id'], name='archivedorder_user_date_idx'), models.Index(fields=['delivery_crew_id', 'date', 'id'], name='archivedorder_crew_date_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('order_id', models.BigIntegerField()),
+                ('menuitem_id', models.BigIntegerField()),
+                ('quantity', models.SmallIntegerField()),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=6)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order_id'], name='archivedorderitem_order_idx')],
+            },
+        ),
+    ]
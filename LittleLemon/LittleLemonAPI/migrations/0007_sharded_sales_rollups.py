@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0006_order_archive'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='dailyitemsales',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='dailyitemsales',
+            name='shard',
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dailysales',
+            name='shard',
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='dailysales',
+            name='date',
+            field=models.DateField(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyitemsales',
+            unique_together={('date', 'menuitem', 'shard')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailysales',
+            unique_together={('date', 'shard')},
+        ),
+    ]
@@ -18,6 +18,13 @@ class MenuItem(models.Model):
     Category = models.ForeignKey(
         Category, on_delete=models.PROTECT)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination over ?ordering=price / ?ordering=title
+            models.Index(fields=['price', 'id'], name='menuitem_price_id_idx'),
+            models.Index(fields=['title', 'id'], name='menuitem_title_id_idx'),
+        ]
+
     def __str__(self) -> str:
         return self.title
 
@@ -30,7 +37,8 @@ class Cart(models.Model):
     price = models.DecimalField(max_digits=6, decimal_places=2)
 
     class Meta:
-        unique_together = ('menuitem', 'user')
+        # User first, so the constraint's index also serves cart lookups
+        unique_together = ('user', 'menuitem')
 
 
 class Order(models.Model):
@@ -41,9 +49,16 @@ class Order(models.Model):
     total = models.DecimalField(max_digits=6, decimal_places=2)
     date = models.DateField(db_index=True)
 
+    class Meta:
+        indexes = [
+            # Customer and delivery crew order lists, newest first
+            models.Index(fields=['user', 'date', 'id'], name='order_user_date_idx'),
+            models.Index(fields=['delivery_crew', 'date', 'id'], name='order_crew_date_idx'),
+        ]
+
 
 class OrderItem(models.Model):
-    order = models.ForeignKey(User, on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE)
     menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
     quantity = models.SmallIntegerField()
     unit_price = models.DecimalField(max_digits=6, decimal_places=2)
@@ -51,3 +66,65 @@ class OrderItem(models.Model):
 
     class Meta:
         unique_together = ('order', 'menuitem')
+
+
+class ArchivedOrder(models.Model):
+    # Delivered orders past the archive horizon, moved out of Order by
+    # archive_orders. Ids are kept, and users are plain ids so the table can
+    # live in a separate archive database (see routers.py).
+    id = models.BigIntegerField(primary_key=True)
+    user_id = models.IntegerField()
+    delivery_crew_id = models.IntegerField(null=True)
+    status = models.BooleanField(default=0)
+    total = models.DecimalField(max_digits=6, decimal_places=2)
+    date = models.DateField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'id'], name='archivedorder_date_idx'),
+            models.Index(fields=['user_id', 'date', 'id'], name='archivedorder_user_date_idx'),
+            models.Index(fields=['delivery_crew_id', 'date', 'id'], name='archivedorder_crew_date_idx'),
+        ]
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order_id = models.BigIntegerField()
+    menuitem_id = models.BigIntegerField()
+    quantity = models.SmallIntegerField()
+    unit_price = models.DecimalField(max_digits=6, decimal_places=2)
+    price = models.DecimalField(max_digits=6, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order_id'], name='archivedorderitem_order_idx'),
+        ]
+
+
+class DailySales(models.Model):
+    # Orders and revenue per day, kept up to date by checkout. A day is
+    # split over shards (see rollups.record_sales); read it by summing them.
+    date = models.DateField()
+    shard = models.SmallIntegerField(default=0)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'shard')
+
+
+class DailyItemSales(models.Model):
+    # Quantity and revenue per day and menu item, kept up to date by
+    # checkout, sharded as DailySales
+    date = models.DateField()
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    shard = models.SmallIntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'menuitem', 'shard')
+        indexes = [
+            models.Index(fields=['category', 'date'], name='itemsales_category_date_idx'),
+        ]
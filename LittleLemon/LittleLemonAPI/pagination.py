@@ -0,0 +1,153 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.settings import api_settings
+
+from .search import SEARCH_RANK
+
+
+class KeysetPagination(CursorPagination):
+    # Cursor pagination over the full ordering key, always ending in the
+    # primary key, e.g. (date, id). The cursor stores the whole key of the
+    # boundary row, so every page is a single index range scan with no
+    # OFFSET and no COUNT(*), however deep the client goes.
+    ordering = ('id',)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view))
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering.append('-id' if ordering[0].startswith('-') else 'id')
+        return tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self._page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self._set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # Same as paginate_queryset, for views using the async ORM
+        queryset = self._page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self._set_page([row async for row in queryset])
+
+    def paginate_querysets(self, querysets, request, view=None):
+        # One page over the union of several querysets with the same
+        # ordering fields, e.g. hot and archived orders: a page is read from
+        # each and the rows merged, so each stays an index range scan
+        pages = [self._page_queryset(queryset, request, view) for queryset in querysets]
+        if pages[0] is None:
+            return None
+        rows = [row for page in pages for row in page]
+        ordering = _invert(self.ordering) if self.reverse else self.ordering
+        for field in reversed(ordering):
+            rows.sort(key=lambda row: _value(row, field.lstrip('-')),
+                      reverse=field.startswith('-'))
+        return self._set_page(rows[:self.page_size + 1])
+
+    def _page_queryset(self, queryset, request, view):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+
+        self.reverse = self.cursor is not None and self.cursor.reverse
+        ordering = _invert(self.ordering) if self.reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(keyset_filter(ordering, self.cursor.position))
+
+        # One extra row tells us whether there is another page
+        return queryset[:self.page_size + 1]
+
+    def _set_page(self, results):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if self.reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(self.page[0], reverse=True)
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return None
+        try:
+            position = json.loads(cursor.position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=cursor.reverse, position=position)
+
+    def _link(self, row, reverse):
+        position = json.dumps(
+            [_value(row, field.lstrip('-')) for field in self.ordering],
+            cls=DjangoJSONEncoder)
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=reverse, position=position))
+
+
+def _value(row, field):
+    if isinstance(row, dict):
+        return row[field]
+    return getattr(row, field)
+
+
+def _invert(ordering):
+    return tuple(field[1:] if field.startswith('-') else '-' + field
+                 for field in ordering)
+
+
+def keyset_filter(ordering, position):
+    # Rows strictly after `position` in `ordering`, i.e. the expansion of
+    # (a, b) > (x, y) into (a > x) OR (a = x AND b > y). The leading bound on
+    # the first field lets the database range-scan its index.
+    first = ordering[0]
+    bound = Q(**{first.lstrip('-') + ('__lte' if first.startswith('-') else '__gte'): position[0]})
+    after = Q()
+    for i, field in enumerate(ordering):
+        lookups = {prev.lstrip('-'): value
+                   for prev, value in zip(ordering[:i], position[:i])}
+        op = '__lt' if field.startswith('-') else '__gt'
+        lookups[field.lstrip('-') + op] = position[i]
+        after |= Q(**lookups)
+    return bound & after
+
+
+class OrderPagination(KeysetPagination):
+    ordering = ('-date', '-id')
+
+
+class MenuItemPagination(KeysetPagination):
+    ordering = ('id',)
+
+    def get_ordering(self, request, queryset, view):
+        # Search results page best match first unless ?ordering= is given
+        if (SEARCH_RANK in queryset.query.annotations
+                and api_settings.ORDERING_PARAM not in request.query_params):
+            return (SEARCH_RANK, 'id')
+        return super().get_ordering(request, queryset, view)
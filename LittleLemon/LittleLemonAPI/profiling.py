@@ -0,0 +1,218 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Upper bounds of the histogram buckets, in seconds and in queries
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Addresses allowed to scrape /metrics, besides superusers
+METRICS_ALLOWED_IPS = getattr(settings, 'METRICS_ALLOWED_IPS', settings.INTERNAL_IPS)
+
+_profile = ContextVar('profile', default=None)
+
+
+class Profile:
+    # Time spent per phase in one request, plus its query count
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.seconds = {'db': 0.0, 'serialize': 0.0, 'render': 0.0}
+        self.depth = {}
+        self.render_format = None
+
+
+@contextmanager
+def timer(phase):
+    # Add the time spent in the block to the current request's `phase`.
+    # Nested timers for the same phase (e.g. a nested serializer) count once.
+    profile = _profile.get()
+    if profile is None or profile.depth.get(phase):
+        yield
+        return
+    profile.depth[phase] = 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.seconds[phase] += time.perf_counter() - start
+        profile.depth[phase] = 0
+
+
+def _execute(execute, sql, params, many, context):
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.seconds['db'] += time.perf_counter() - start
+        profile.queries += 1
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # Once per connection, rather than an execute_wrapper() per request
+    if _execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute)
+
+
+def rendering(format):
+    # timer('render') for responses rendered outside DRF's Response
+    profile = _profile.get()
+    if profile is not None:
+        profile.render_format = format
+    return timer('render')
+
+
+class TimedSerializerMixin:
+    # Counts to_representation towards the request's 'serialize' phase
+
+    def to_representation(self, instance):
+        with timer('serialize'):
+            return super().to_representation(instance)
+
+
+class Histogram:
+    # Cumulative-bucket histogram per label set, in the Prometheus sense
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def lines(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self.lock:
+            series = [(labels, list(counts), total, count)
+                      for labels, (counts, total, count) in self.series.items()]
+        for labels, counts, total, count in sorted(series):
+            label = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket
+                yield f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}'
+            yield f'{self.name}_sum{{{label}}} {total}'
+            yield f'{self.name}_count{{{label}}} {count}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_SECONDS = Histogram(
+    'littlelemon_request_seconds', 'Time spent handling a request.', SECONDS_BUCKETS)
+DB_SECONDS = Histogram(
+    'littlelemon_db_seconds', 'Time spent in database queries per request.', SECONDS_BUCKETS)
+DB_QUERIES = Histogram(
+    'littlelemon_db_queries', 'Database queries per request.', QUERY_BUCKETS)
+SERIALIZE_SECONDS = Histogram(
+    'littlelemon_serialize_seconds', 'Time spent in serializers per request.', SECONDS_BUCKETS)
+RENDER_SECONDS = Histogram(
+    'littlelemon_render_seconds', 'Time spent rendering the response body.', SECONDS_BUCKETS)
+
+HISTOGRAMS = [REQUEST_SECONDS, DB_SECONDS, DB_QUERIES, SERIALIZE_SECONDS, RENDER_SECONDS]
+
+
+class ProfilingMiddleware:
+    # Times each request's database, serializer and render phases, reports
+    # them in a Server-Timing header and feeds the /metrics histograms.
+    # Costs a few perf_counter() calls per request and per query.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = Profile()
+        token = _profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+        self.record(request, response, profile)
+        return response
+
+    async def __acall__(self, request):
+        profile = Profile()
+        token = _profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _profile.reset(token)
+        self.record(request, response, profile)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses render after the view returns; time that too
+        profile = _profile.get()
+        if profile is not None:
+            start = time.perf_counter()
+            renderer = getattr(response, 'accepted_renderer', None)
+            profile.render_format = getattr(renderer, 'format', None)
+
+            def rendered(response):
+                profile.seconds['render'] += time.perf_counter() - start
+            response.add_post_render_callback(rendered)
+        return response
+
+    def record(self, request, response, profile):
+        total = time.perf_counter() - profile.start
+        seconds = profile.seconds
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={seconds["db"] * 1000:.1f};desc="{profile.queries} queries"',
+            f'serialize;dur={seconds["serialize"] * 1000:.1f}',
+            f'render;dur={seconds["render"] * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+        match = request.resolver_match
+        # The URL pattern, not the path, to keep the label set bounded
+        labels = (('method', request.method),
+                  ('route', match.route if match else 'unmatched'),
+                  ('status', response.status_code // 100 * 100))
+        REQUEST_SECONDS.observe(labels, total)
+        DB_SECONDS.observe(labels, seconds['db'])
+        DB_QUERIES.observe(labels, profile.queries)
+        SERIALIZE_SECONDS.observe(labels, seconds['serialize'])
+        RENDER_SECONDS.observe(
+            labels + (('format', profile.render_format or 'none'),), seconds['render'])
+
+
+def metrics(request):
+    # Prometheus text exposition of this process's histograms
+    user = getattr(request, 'user', None)
+    if (request.META.get('REMOTE_ADDR') not in METRICS_ALLOWED_IPS
+            and not (user and user.is_superuser)):
+        return HttpResponseForbidden()
+    lines = [line for histogram in HISTOGRAMS for line in histogram.lines()]
+    return HttpResponse('\n'.join(lines) + '\n',
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
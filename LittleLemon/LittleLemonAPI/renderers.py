@@ -0,0 +1,46 @@
+from django.utils.module_loading import import_string
+from rest_framework.renderers import BaseRenderer
+
+
+class LazyRenderer(BaseRenderer):
+    # Stands in for a renderer class during content negotiation, and only
+    # imports it the first time a response is rendered in that format.
+    # DRF instantiates every renderer class on every request, so nothing
+    # is loaded before render() (or another attribute of the real renderer)
+    # is needed. Rarely used formats then cost nothing at worker boot.
+    renderer_path = None
+    _renderer = None
+
+    @classmethod
+    def load(cls):
+        if cls._renderer is None:
+            cls._renderer = import_string(cls.renderer_path)
+        return cls._renderer
+
+    @property
+    def renderer(self):
+        renderer = self.__dict__.get('_instance')
+        if renderer is None:
+            renderer = self.__dict__['_instance'] = self.load()()
+        return renderer
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return self.renderer.render(data, accepted_media_type, renderer_context)
+
+    def __getattr__(self, name):
+        # Only reached for attributes this class doesn't have
+        return getattr(self.renderer, name)
+
+
+class BrowsableAPIRenderer(LazyRenderer):
+    renderer_path = 'rest_framework.renderers.BrowsableAPIRenderer'
+    media_type = 'text/html'
+    format = 'api'
+    charset = 'utf-8'
+
+
+class XMLRenderer(LazyRenderer):
+    renderer_path = 'rest_framework_xml.renderers.XMLRenderer'
+    media_type = 'application/xml'
+    format = 'xml'
+    charset = 'utf-8'
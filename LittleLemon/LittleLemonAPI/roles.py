@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.cache import cache
+
+MANAGER = 'Manager'
+DELIVERY_CREW = 'Delivery crew'
+
+# How long a user's group names stay in the shared cache
+ROLE_CACHE_TTL = getattr(settings, 'ROLE_CACHE_TTL', 300)
+
+
+def _cache_key(user_id):
+    return f'roles:{user_id}'
+
+
+def get_roles(user):
+    # Anonymous users never belong to a group
+    if not user or not user.is_authenticated:
+        return frozenset()
+
+    # request.user lives for the whole request, so memoise on the instance
+    roles = getattr(user, '_roles', None)
+    if roles is not None:
+        return roles
+
+    key = _cache_key(user.pk)
+    roles = cache.get(key)
+    if roles is None:
+        roles = frozenset(user.groups.values_list('name', flat=True))
+        cache.set(key, roles, ROLE_CACHE_TTL)
+
+    user._roles = roles
+    return roles
+
+
+async def aget_roles(user):
+    # get_roles for async views
+    if not user or not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, '_roles', None)
+    if roles is not None:
+        return roles
+
+    key = _cache_key(user.pk)
+    roles = await cache.aget(key)
+    if roles is None:
+        roles = frozenset([name async for name in
+                           user.groups.values_list('name', flat=True)])
+        await cache.aset(key, roles, ROLE_CACHE_TTL)
+
+    user._roles = roles
+    return roles
+
+
+def invalidate_roles(user):
+    cache.delete(_cache_key(user.pk))
+    if hasattr(user, '_roles'):
+        del user._roles
+
+
+def invalidate_roles_for(user_ids):
+    # invalidate_roles by primary key, for membership changes seen from
+    # the group's side
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+def is_manager(user):
+    return user.is_superuser or MANAGER in get_roles(user)
+
+
+def is_delivery_crew(user):
+    return DELIVERY_CREW in get_roles(user)
+
+
+async def ais_manager(user):
+    return user.is_superuser or MANAGER in await aget_roles(user)
+
+
+async def ais_delivery_crew(user):
+    return DELIVERY_CREW in await aget_roles(user)
@@ -0,0 +1,141 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum
+
+from .models import (ArchivedOrder, ArchivedOrderItem, DailyItemSales, DailySales,
+                     MenuItem, Order, OrderItem)
+from .upserts import bulk_upsert_add
+
+BACKFILL_BATCH_SIZE = 5000
+# Rows each day's rollups are spread over, so concurrent checkouts update
+# different rows instead of queueing on one. Reads sum every row of a day,
+# so the number can be changed at any time.
+SALES_ROLLUP_SHARDS = getattr(settings, 'SALES_ROLLUP_SHARDS', 16)
+
+# Set while orders are being moved rather than deleted (see archive.py)
+_keeping_sales = ContextVar('keeping_sales', default=False)
+
+
+def record_sales(order_id, date, total, lines, sign=1):
+    # Add one order to the day's rollups, in the order's shard. `lines` are
+    # (menuitem_id, category_id, quantity, price) tuples; sign=-1 takes the
+    # order back out again.
+    shard = order_id % SALES_ROLLUP_SHARDS
+    bulk_upsert_add(
+        DailySales,
+        [{'date': date, 'shard': shard, 'orders': sign, 'revenue': sign * total}],
+        unique_fields=['date', 'shard'], add_fields=['orders', 'revenue'])
+
+    items = {}
+    for menuitem_id, category_id, quantity, price in lines:
+        row = items.setdefault(menuitem_id, {
+            'date': date, 'menuitem': menuitem_id, 'category': category_id,
+            'shard': shard, 'quantity': 0, 'revenue': 0})
+        row['quantity'] += sign * quantity
+        row['revenue'] += sign * price
+    bulk_upsert_add(
+        DailyItemSales, list(items.values()),
+        unique_fields=['date', 'menuitem', 'shard'], add_fields=['quantity', 'revenue'],
+        set_fields=['category'])
+
+
+def unrecord_order(order):
+    # Take a deleted order back out, whichever way it was deleted (see the
+    # pre_delete receiver in signals.py)
+    if _keeping_sales.get():
+        return
+    lines = OrderItem.objects.filter(order=order).values_list(
+        'menuitem_id', 'menuitem__Category_id', 'quantity', 'price')
+    record_sales(order.id, order.date, order.total, list(lines), sign=-1)
+
+
+@contextmanager
+def sales_kept():
+    # Orders deleted in the block stay in the rollups, e.g. when archiving
+    token = _keeping_sales.set(True)
+    try:
+        yield
+    finally:
+        _keeping_sales.reset(token)
+
+
+def _in_range(queryset, start, end):
+    if start:
+        queryset = queryset.filter(date__gte=start)
+    if end:
+        queryset = queryset.filter(date__lte=end)
+    return queryset
+
+
+def rebuild_sales_rollups(start=None, end=None):
+    # Recompute the rollups for [start, end] (all history by default) from
+    # Order and OrderItem, and the archived orders they were moved from.
+    # Each day is rebuilt into shard 0.
+    orders = _in_range(Order.objects.all(), start, end)
+    items = OrderItem.objects.filter(order__in=orders)
+
+    daily = orders.values('date').annotate(
+        count=Count('id'), total=Sum('total')).order_by('date')
+    per_item = items.values(
+        'order__date', 'menuitem_id', 'menuitem__Category_id').annotate(
+        count=Sum('quantity'), total=Sum('price')).order_by()
+
+    with transaction.atomic():
+        for model in (DailySales, DailyItemSales):
+            _in_range(model.objects.all(), start, end).delete()
+
+        _bulk_create(DailySales, (
+            DailySales(date=row['date'], orders=row['count'], revenue=row['total'])
+            for row in daily.iterator()))
+        _bulk_create(DailyItemSales, (
+            DailyItemSales(date=row['order__date'], menuitem_id=row['menuitem_id'],
+                           category_id=row['menuitem__Category_id'],
+                           quantity=row['count'], revenue=row['total'])
+            for row in per_item.iterator()))
+        _add_archived_sales(start, end)
+
+
+def _add_archived_sales(start, end):
+    # Added onto the rows just built. The archive may be another database,
+    # so menu item categories are looked up separately.
+    orders = _in_range(ArchivedOrder.objects.all(), start, end)
+    daily = orders.values('date').annotate(
+        count=Count('id'), total=Sum('total')).order_by('date')
+    per_item = ArchivedOrderItem.objects.filter(
+        order_id__in=orders.values('id')).annotate(date=Subquery(
+            ArchivedOrder.objects.filter(id=OuterRef('order_id')).values('date')[:1])
+    ).values('date', 'menuitem_id').annotate(
+        count=Sum('quantity'), total=Sum('price')).order_by()
+    categories = dict(MenuItem.objects.values_list('id', 'Category_id'))
+
+    _bulk_upsert_add(DailySales, (
+        {'date': row['date'], 'shard': 0, 'orders': row['count'], 'revenue': row['total']}
+        for row in daily.iterator()), ['date', 'shard'], ['orders', 'revenue'])
+    _bulk_upsert_add(DailyItemSales, (
+        {'date': row['date'], 'menuitem': row['menuitem_id'], 'shard': 0,
+         'category': categories[row['menuitem_id']],
+         'quantity': row['count'], 'revenue': row['total']}
+        for row in per_item.iterator()
+        # Sales of items since taken off the menu, as the cascade would
+        if row['menuitem_id'] in categories), ['date', 'menuitem', 'shard'], ['quantity', 'revenue'])
+
+
+def _bulk_create(model, objects):
+    # bulk_create() materialises its input; feed it one batch at a time
+    while True:
+        batch = list(islice(objects, BACKFILL_BATCH_SIZE))
+        if not batch:
+            return
+        model.objects.bulk_create(batch)
+
+
+def _bulk_upsert_add(model, rows, unique_fields, add_fields):
+    while True:
+        batch = list(islice(rows, BACKFILL_BATCH_SIZE))
+        if not batch:
+            return
+        bulk_upsert_add(model, batch, unique_fields=unique_fields, add_fields=add_fields)
@@ -0,0 +1,182 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.utils import DatabaseError
+from rest_framework.permissions import SAFE_METHODS
+
+# Reads are sent to a replica only inside views that opt in (see
+# ReplicaReadMixin), and only until the request writes. A user whose
+# request wrote, through any view, stays pinned to the primary for
+# REPLICA_PIN_SECONDS (see ReplicaPinMiddleware), so they read their own
+# writes despite replication lag.
+
+_replica_reads = ContextVar('replica_reads', default=False)
+# The aliases written in the current request. A mutable set, so writes made
+# in a sync_to_async thread are seen by the request's own context too.
+_writes = ContextVar('writes', default=None)
+
+# alias -> (healthy, checked at)
+_health = {}
+
+
+def _replica_is_healthy(alias):
+    interval = getattr(settings, 'REPLICA_HEALTH_CHECK_INTERVAL', 5)
+    healthy, checked = _health.get(alias, (None, 0))
+    now = time.monotonic()
+    if healthy is None or now - checked > interval:
+        connection = connections[alias]
+        try:
+            connection.ensure_connection()
+            healthy = connection.is_usable()
+        except DatabaseError:
+            healthy = False
+        if not healthy:
+            connection.close()
+        _health[alias] = (healthy, now)
+    return healthy
+
+
+# Cold order history lives in settings.ARCHIVE_DATABASE (see archive.py)
+ARCHIVE_MODELS = {'archivedorder', 'archivedorderitem'}
+
+
+def _archive_db():
+    return getattr(settings, 'ARCHIVE_DATABASE', 'default')
+
+
+def _is_archive(model):
+    return model._meta.app_label == 'LittleLemonAPI' and model._meta.model_name in ARCHIVE_MODELS
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _is_archive(model):
+            return _archive_db()
+        if not _replica_reads.get() or _writes.get():
+            return None
+        replicas = [alias for alias in getattr(settings, 'DATABASE_REPLICAS', [])
+                    if _replica_is_healthy(alias)]
+        if replicas:
+            return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        if _is_archive(model):
+            return _archive_db()
+        writes = _writes.get()
+        if writes is not None:
+            writes.add('default')
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A separate archive database holds only the archive tables
+        if _archive_db() == 'default':
+            return None
+        is_archive = app_label == 'LittleLemonAPI' and model_name in ARCHIVE_MODELS
+        return is_archive == (db == _archive_db())
+
+
+def _pin_key(user):
+    return f'replica-pin:{user.pk}'
+
+
+def pin_to_primary(user):
+    if user.is_authenticated:
+        cache.set(_pin_key(user), True,
+                  getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+
+
+def is_pinned(user):
+    return user.is_authenticated and cache.get(_pin_key(user), False)
+
+
+async def ais_pinned(user):
+    return user.is_authenticated and await cache.aget(_pin_key(user), False)
+
+
+def enable_replica_reads(user):
+    if not is_pinned(user):
+        _replica_reads.set(True)
+
+
+async def aenable_replica_reads(user):
+    if not await ais_pinned(user):
+        _replica_reads.set(True)
+
+
+@contextmanager
+def primary_reads():
+    # Reads in the block go to the primary even where replica reads are on,
+    # e.g. to fill a cache whose key promises data as of now
+    replica_reads = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(replica_reads)
+
+
+class ReplicaPinMiddleware:
+    # Tracks the writes of each request and pins its user to the primary if
+    # there were any. Goes after AuthenticationMiddleware; DRF views set
+    # request.user for token authentication too.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        writes = _writes.set(set())
+        try:
+            response = self.get_response(request)
+            if _writes.get():
+                self.pin(request)
+            return response
+        finally:
+            _writes.reset(writes)
+
+    async def __acall__(self, request):
+        writes = _writes.set(set())
+        try:
+            response = await self.get_response(request)
+            if _writes.get():
+                await sync_to_async(self.pin)(request)
+            return response
+        finally:
+            _writes.reset(writes)
+
+    def pin(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None:
+            pin_to_primary(user)
+
+
+class ReplicaReadMixin:
+    # Lets a view's safe requests read from a replica
+
+    def dispatch(self, request, *args, **kwargs):
+        replica_reads = _replica_reads.set(False)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(replica_reads)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Authentication and throttling above always use the primary
+        if request.method in SAFE_METHODS:
+            enable_replica_reads(request.user)
@@ -0,0 +1,130 @@
+from django.db import connections
+from django.db.models.expressions import RawSQL
+from django.db.utils import OperationalError
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
+
+from .models import MenuItem
+
+# On SQLite, menu titles are indexed in an FTS5 table that triggers keep in
+# step with MenuItem, so inserts, updates and deletes made outside the ORM's
+# signals (bulk_create, queryset.update(), raw SQL) are indexed as well.
+# Searches become an index lookup with relevance ranking instead of a
+# LIKE '%term%' scan of the whole menu. Other backends fall back to DRF's
+# SearchFilter.
+
+SEARCH_TABLE = 'menuitem_search'
+SEARCH_RANK = 'search_rank'
+
+_TRIGGERS = {
+    'menuitem_search_ai': '''
+        CREATE TRIGGER IF NOT EXISTS menuitem_search_ai
+        AFTER INSERT ON {items} BEGIN
+            INSERT INTO {search} (rowid, title) VALUES (new.id, new.title);
+        END''',
+    'menuitem_search_ad': '''
+        CREATE TRIGGER IF NOT EXISTS menuitem_search_ad
+        AFTER DELETE ON {items} BEGIN
+            INSERT INTO {search} ({search}, rowid, title)
+            VALUES ('delete', old.id, old.title);
+        END''',
+    'menuitem_search_au': '''
+        CREATE TRIGGER IF NOT EXISTS menuitem_search_au
+        AFTER UPDATE OF title ON {items} BEGIN
+            INSERT INTO {search} ({search}, rowid, title)
+            VALUES ('delete', old.id, old.title);
+            INSERT INTO {search} (rowid, title) VALUES (new.id, new.title);
+        END''',
+}
+
+# alias -> whether the search table exists there
+_available = {}
+
+
+def _sqlite_master(cursor, kind, names):
+    cursor.execute(
+        f'SELECT name FROM sqlite_master WHERE type = %s '
+        f'AND name IN ({", ".join(["%s"] * len(names))})', [kind, *names])
+    return {name for name, in cursor.fetchall()}
+
+
+def install_search_index(connection, create=True):
+    # Create the index and its triggers if missing, and rebuild it from the
+    # menu table whenever a trigger had to be (re)created. SQLite drops a
+    # table's triggers when a migration remakes the table, so this also
+    # runs after every migrate (see apps.py) with create=False.
+    if connection.vendor != 'sqlite':
+        return
+    qn = connection.ops.quote_name
+    items = qn(MenuItem._meta.db_table)
+    with connection.cursor() as cursor:
+        if not _sqlite_master(cursor, 'table', [SEARCH_TABLE]):
+            if not create:
+                return
+            try:
+                # Prefix indexes make 2- and 3-character type-ahead cheap
+                cursor.execute(
+                    f'CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5('
+                    f"title, content={items}, content_rowid='id', "
+                    f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+            except OperationalError:
+                # SQLite built without FTS5; searches fall back to LIKE
+                return
+        existing = _sqlite_master(cursor, 'trigger', list(_TRIGGERS))
+        if existing == set(_TRIGGERS):
+            return
+        for sql in _TRIGGERS.values():
+            cursor.execute(sql.format(items=items, search=SEARCH_TABLE))
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('rebuild')")
+    _available.pop(connection.alias, None)
+
+
+def uninstall_search_index(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name in _TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+    _available.pop(connection.alias, None)
+
+
+def search_index_available(alias):
+    available = _available.get(alias)
+    if available is None:
+        connection = connections[alias]
+        available = False
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                available = bool(_sqlite_master(cursor, 'table', [SEARCH_TABLE]))
+        _available[alias] = available
+    return available
+
+
+def match_expression(terms):
+    # Every term must match as a word prefix, so "chick sal" finds
+    # "Chicken Salad". Terms are quoted to keep FTS5 syntax out of user input.
+    return ' '.join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+
+class MenuSearchFilter(SearchFilter):
+    # ?search= over the menu's FTS5 index. Matches are annotated with their
+    # bm25 rank (lower is better) and listed best first unless the request
+    # picks an ?ordering=; MenuItemPagination pages over (rank, id).
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms or not search_index_available(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+
+        match = match_expression(terms)
+        items = connections[queryset.db].ops.quote_name(MenuItem._meta.db_table)
+        queryset = queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+            [match])).annotate(**{SEARCH_RANK: RawSQL(
+                f'SELECT rank FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+                f'AND rowid = {items}.id', [match])})
+        if api_settings.ORDERING_PARAM not in request.query_params:
+            queryset = queryset.order_by(SEARCH_RANK, 'id')
+        return queryset
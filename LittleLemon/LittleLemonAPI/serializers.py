@@ -2,16 +2,18 @@ from rest_framework import serializers
 from .models import MenuItem, Category, Cart, Order, OrderItem
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
-import datetime
+from .checkout import checkout
+from .carts import add_to_cart, get_cart_store
+from .profiling import TimedSerializerMixin
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'title']
 
 
-class MenuItemSerializer(serializers.ModelSerializer):
+class MenuItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     Category_id = serializers.IntegerField(write_only=True)
     Category = CategorySerializer(read_only=True)
 
@@ -21,7 +23,7 @@ class MenuItemSerializer(serializers.ModelSerializer):
                   'featured', 'Category', 'Category_id']
 
 
-class UserGroupSerializer(serializers.ModelSerializer):
+class UserGroupSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['username', 'email',]
@@ -32,7 +34,7 @@ class UserGroupSerializer(serializers.ModelSerializer):
         return super(UserGroupSerializer, self).create(validated_data)
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Cart
         fields = '__all__'
@@ -42,142 +44,52 @@ class CartSerializer(serializers.ModelSerializer):
         # Get the user from the request
         user = self.context['request'].user
 
-        # Get the menuitem from the validated data
+        # DRF has already resolved the menuitem; adding one that is in the
+        # cart already adds to its quantity and price
         menuitem = validated_data['menuitem']
+        add_to_cart(user, [(menuitem.pk, validated_data['quantity'])])
+        return get_cart_store().line(user, menuitem.pk)
 
-        # Retrieve the corresponding MenuItem instance
-        menuitem_instance = MenuItem.objects.get(pk=menuitem.pk)
 
-        # Calculate the unit_price as the price of the MenuItem
-        unit_price = menuitem_instance.price
+class CartLineSerializer(serializers.Serializer):
+    menuitem = serializers.IntegerField()
+    # Cart.quantity is a SmallIntegerField
+    quantity = serializers.IntegerField(min_value=1, max_value=32767)
 
-        # Calculate the total price as the unit_price * quantity
-        quantity = validated_data['quantity']
-        price = unit_price * quantity
 
-        cart = Cart.objects.create(
-            user=user,
-            menuitem=menuitem,
-            quantity=quantity,
-            unit_price=unit_price,
-            price=price
-        )
+class CheckoutMixin:
+    def create(self, validated_data):
+        # Get the user from the request
+        user = self.context['request'].user
 
-        return cart
+        order = checkout(user)
+        if order is None:
+            raise serializers.ValidationError('Cart is empty')
+        return order
 
 
-class AdminOrderSerializer(serializers.ModelSerializer):
+class AdminOrderSerializer(CheckoutMixin, TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = '__all__'
         read_only_fields = ('user', 'total', 'date')
 
-    def create(self, validated_data):
-        # Get the user from the request
-        user = self.context['request'].user
 
-        total = 0
-        user_cart = Cart.objects.filter(user=user).all()
-        for cartitem in user_cart:
-            total += cartitem.price
-
-        date = datetime.date.today()
-
-        order = Order.objects.create(
-            user=user,
-            delivery_crew=None,
-            status=0,
-            total=total,
-            date=date
-        )
-        objectlist = []
-        for cart_item in user_cart:
-            objectlist = OrderItem.objects.create(
-                order=user,
-                menuitem=cart_item.menuitem,
-                quantity=cart_item.quantity,
-                unit_price=cart_item.unit_price,
-                price=cart_item.price
-            )
-        user_cart.delete()
-        return objectlist
-
-
-class CrewOrderSerializer(serializers.ModelSerializer):
+class CrewOrderSerializer(CheckoutMixin, TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = '__all__'
         read_only_fields = ('user', 'total', 'delivery_crew', 'date')
 
-    def create(self, validated_data):
-        # Get the user from the request
-        user = self.context['request'].user
 
-        total = 0
-        user_cart = Cart.objects.filter(user=user).all()
-        for cartitem in user_cart:
-            total += cartitem.price
-
-        date = datetime.date.today()
-
-        order = Order.objects.create(
-            user=user,
-            delivery_crew=None,
-            status=0,
-            total=total,
-            date=date
-        )
-        objectlist = []
-        for cart_item in user_cart:
-            objectlist = OrderItem.objects.create(
-                order=user,
-                menuitem=cart_item.menuitem,
-                quantity=cart_item.quantity,
-                unit_price=cart_item.unit_price,
-                price=cart_item.price
-            )
-        user_cart.delete()
-        return objectlist
-
-
-class CustomerOrderSerializer(serializers.ModelSerializer):
+class CustomerOrderSerializer(CheckoutMixin, TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ['user', 'total', 'status', 'date']
         read_only_fields = ('user', 'total', 'status', 'date')
 
-    def create(self, validated_data):
-        # Get the user from the request
-        user = self.context['request'].user
 
-        total = 0
-        user_cart = Cart.objects.filter(user=user).all()
-        for cartitem in user_cart:
-            total += cartitem.price
-
-        date = datetime.date.today()
-
-        order = Order.objects.create(
-            user=user,
-            delivery_crew=None,
-            status=0,
-            total=total,
-            date=date
-        )
-        objectlist = []
-        for cart_item in user_cart:
-            objectlist = OrderItem.objects.create(
-                order=user,
-                menuitem=cart_item.menuitem,
-                quantity=cart_item.quantity,
-                unit_price=cart_item.unit_price,
-                price=cart_item.price
-            )
-        user_cart.delete()
-        return objectlist
-
-
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = '__all__'
@@ -0,0 +1,57 @@
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token
+from .caching import bump_menu_version
+from .models import Category, MenuItem, Order
+from .roles import invalidate_roles, invalidate_roles_for
+from .rollups import unrecord_order
+
+
+@receiver([post_save, post_delete], sender=MenuItem)
+@receiver([post_save, post_delete], sender=Category)
+def menu_changed(sender, **kwargs):
+    bump_menu_version()
+
+
+@receiver(pre_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    # However an order is deleted (the API, the admin, a cascade from its
+    # user), take it out of the sales rollups. Before the delete, as its
+    # lines go first in a cascade.
+    unrecord_order(instance)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, **kwargs):
+    # Deactivation (or any other change) must not be served from the cache
+    for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Group membership changed anywhere (the API, the admin, the shell):
+    # drop the cached roles of every user involved. A clear is seen before
+    # it happens, while the group's members can still be listed.
+    if reverse:
+        if action == 'pre_clear':
+            invalidate_roles_for(instance.user_set.values_list('pk', flat=True))
+        elif action in ('post_add', 'post_remove'):
+            invalidate_roles_for(pk_set)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_roles(instance)
+
+
+@receiver([post_save, pre_delete], sender=Group)
+def group_changed(sender, instance, created=False, **kwargs):
+    # A renamed or deleted group changes its members' roles too
+    if not created:
+        invalidate_roles_for(instance.user_set.values_list('pk', flat=True))
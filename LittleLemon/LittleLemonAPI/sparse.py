@@ -0,0 +1,99 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import BaseSerializer
+
+# ?fields=id,title,price picks the fields a list response carries. The same
+# choice is pushed down into the query: unrequested columns aren't
+# selected, and an unrequested nested object isn't joined.
+FIELDS_PARAM = 'fields'
+
+
+def requested_fields(query_params, available):
+    # The requested names in `available` order, or None when the parameter
+    # is absent. Unknown names are a 400, as a typo would otherwise quietly
+    # return nothing.
+    raw = query_params.get(FIELDS_PARAM)
+    if raw is None:
+        return None
+    names = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = sorted(names.difference(available))
+    if unknown or not names:
+        raise ValidationError({FIELDS_PARAM: [
+            f'Unknown field(s): {", ".join(unknown) or "(none given)"}. '
+            f'Choose from: {", ".join(available)}.']})
+    return tuple(name for name in available if name in names)
+
+
+def readable_fields(serializer_class):
+    return [field.field_name for field in serializer_class()._readable_fields]
+
+
+def trim(serializer, fields):
+    # Drop the unrequested fields from a (possibly many=True) serializer
+    if fields is not None:
+        target = getattr(serializer, 'child', serializer)
+        for name in list(target.fields):
+            if name not in fields:
+                target.fields.pop(name)
+    return serializer
+
+
+def project(queryset, serializer_class, fields, keep=()):
+    # Load only the columns the requested fields read, plus `keep` (e.g.
+    # ordering keys), joining a nested serializer's model only if asked for
+    if fields is None:
+        return queryset
+    serializer = serializer_class()
+    model = queryset.model
+    columns = {model._meta.pk.name, *keep}
+    related = []
+    for name in fields:
+        field = serializer.fields[name]
+        if isinstance(field, BaseSerializer):
+            related.append(field.source)
+            columns.add(field.source)
+            columns.update(f'{field.source}__{child.source}'
+                           for child in field._readable_fields)
+        else:
+            columns.add(field.source)
+    return queryset.select_related(*related).only(*columns)
+
+
+def pick(rows, fields):
+    # Trim already-built response dicts
+    if fields is None:
+        return rows
+    return [{name: row[name] for name in fields} for row in rows]
+
+
+class SparseFieldsMixin:
+    # ?fields= for a generic list view: trims its serializer and projects
+    # its queryset (see CompiledListMixin for the compiled path)
+
+    def sparse_fields(self):
+        if self.request.method != 'GET':
+            return None
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = requested_fields(
+                self.request.query_params, readable_fields(self.get_serializer_class()))
+        return self._sparse_fields
+
+    def sparse_keep(self, queryset):
+        # Columns pagination reads off each row, whatever was requested: the
+        # primary key and the paginator's ordering (annotations such as a
+        # search rank are kept anyway)
+        keep = [queryset.model._meta.pk.name]
+        if hasattr(self.paginator, 'get_ordering'):
+            keep += [name.lstrip('-') for name in self.paginator.get_ordering(
+                self.request, queryset, self)]
+        return [name for name in dict.fromkeys(keep)
+                if name not in queryset.query.annotations]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.sparse_fields() is None:
+            return queryset
+        return project(queryset, self.get_serializer_class(),
+                       self.sparse_fields(), self.sparse_keep(queryset))
+
+    def get_serializer(self, *args, **kwargs):
+        return trim(super().get_serializer(*args, **kwargs), self.sparse_fields())
@@ -0,0 +1,112 @@
+import logging
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import URLPattern, get_resolver
+from rest_framework.serializers import BaseSerializer
+from rest_framework.settings import api_settings
+
+from . import serializers
+from .compiled import CompiledListMixin, compile_serializer
+from .renderers import LazyRenderer
+
+logger = logging.getLogger(__name__)
+
+# Seconds a worker may take from boot to the end of its first response
+STARTUP_BUDGET = getattr(settings, 'STARTUP_BUDGET', 2.0)
+
+
+def _patterns(resolver):
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLPattern):
+            yield pattern
+        else:
+            yield from _patterns(pattern)
+
+
+def warm_up():
+    # Build every lazily initialised cache a first request would otherwise
+    # pay for, without touching the database. Run before forking (e.g.
+    # gunicorn --preload) so workers share it all copy-on-write.
+    resolver = get_resolver()
+    resolver.reverse_dict
+    views = set()
+    for pattern in _patterns(resolver):
+        pattern.pattern.regex
+        view_class = getattr(pattern.callback, 'view_class', None)
+        if view_class is not None:
+            views.add(view_class)
+
+    for model in apps.get_models():
+        model._meta.get_fields()
+
+    for renderer in api_settings.DEFAULT_RENDERER_CLASSES:
+        if issubclass(renderer, LazyRenderer):
+            renderer.load()
+    get_template('rest_framework/api.html')
+
+    for serializer in vars(serializers).values():
+        if (isinstance(serializer, type) and issubclass(serializer, BaseSerializer)
+                and serializer.__module__ == serializers.__name__):
+            serializer().fields
+    for view in views:
+        if issubclass(view, CompiledListMixin):
+            compile_serializer(view.serializer_class)
+
+    # Forked workers must not share a connection
+    connections.close_all()
+
+
+def _boot(started):
+    # Returns the seconds from `started` to a ready application
+    if getattr(settings, 'WARM_UP_ON_START', False):
+        warm_up()
+    ready = time.perf_counter() - started
+    logger.info('Application ready in %.0f ms', ready * 1000)
+    return ready
+
+
+def _report(ready, request_started):
+    # Idle time before the first request arrives is not counted
+    first_response = time.perf_counter() - request_started
+    log = logger.warning if ready + first_response > STARTUP_BUDGET else logger.info
+    log('Worker %s: ready in %.0f ms, first response took %.0f ms (budget %.0f ms)',
+        os.getpid(), ready * 1000, first_response * 1000, STARTUP_BUDGET * 1000)
+
+
+def wsgi_startup(application, started):
+    # Warm up if configured, and log time to the first response. `started`
+    # is the perf_counter() at the top of wsgi.py.
+    ready = _boot(started)
+    first = True
+
+    def timed(environ, start_response):
+        nonlocal first
+        if not first:
+            return application(environ, start_response)
+        first = False
+        request_started = time.perf_counter()
+        response = application(environ, start_response)
+        _report(ready, request_started)
+        return response
+    return timed
+
+
+def asgi_startup(application, started):
+    # wsgi_startup for asgi.py
+    ready = _boot(started)
+    first = True
+
+    async def timed(scope, receive, send):
+        nonlocal first
+        if not first or scope['type'] != 'http':
+            return await application(scope, receive, send)
+        first = False
+        request_started = time.perf_counter()
+        await application(scope, receive, send)
+        _report(ready, request_started)
+    return timed
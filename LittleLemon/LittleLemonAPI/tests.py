@@ -1,3 +1,940 @@
-from django.test import TestCase
+import copy
+import datetime
+import importlib
+import io
+import json
+import tempfile
+import threading
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import QuerySet, Sum
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.test import APITestCase
+from rest_framework.throttling import SimpleRateThrottle
+
+from . import async_views, carts, events, idempotency, search, throttling, views
+from .archive import archive_orders
+from .authentication import _local as local_tokens
+from .carts import CacheCartStore, CartBusy, DatabaseCartStore
+from .checks import check_event_broker
+from .compiled import CompiledListMixin, compile_serializer
+from .events import ORDER_EVENTS_POLL_TIMEOUT, InProcessBroker, get_broker, order_event
+from .imports import json_rows
+from .management.commands.load_test import throttling_disabled
+from .models import Cart, Category, DailyItemSales, DailySales, MenuItem, Order
+from .renderers import BrowsableAPIRenderer, XMLRenderer
+from .roles import DELIVERY_CREW, MANAGER
+from .rollups import rebuild_sales_rollups
+from .serializers import CategorySerializer, MenuItemSerializer
+from .sparse import readable_fields, trim
+from .startup import _patterns
+from .throttling import AnonThrottle, SQLiteThrottleStore
+
+# A second SQLite database standing in for a read replica. Test databases
+# are set up after the tests are collected, so it gets its own, migrated.
+connections.settings.setdefault('replica', {
+    **copy.deepcopy(connections.settings['default']),
+    'NAME': connections.settings['default']['NAME'].with_name('replica.sqlite3'),
+})
+
+
+class LittleLemonTestCase(APITestCase):
+
+    def setUp(self):
+        # Throttles and the caches would otherwise carry over between tests
+        self.enterContext(throttling_disabled())
+        cache.clear()
+        local_tokens.clear()
+        self.managers = Group.objects.create(name=MANAGER)
+        self.crew = Group.objects.create(name=DELIVERY_CREW)
+
+    def make_user(self, username, *groups, **fields):
+        user = User.objects.create_user(username, f'{username}@example.com',
+                                        'littlelemon', **fields)
+        for group in groups:
+            group.user_set.add(user)
+        user.token = Token.objects.create(user=user).key
+        return user
+
+    def login(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {user.token}')
+
+    def make_menu(self, count, using='default'):
+        category = Category.objects.using(using).create(slug='mains', title='Mains')
+        return [MenuItem.objects.using(using).create(
+            title=f'Dish {i}', price=Decimal(10 + i), featured=False, Category=category)
+            for i in range(count)]
+
+    def place_order(self, user, *menuitems):
+        self.login(user)
+        response = self.client.post('/api/cart/menu-items/batch', [
+            {'menuitem': menuitem.id, 'quantity': 1} for menuitem in menuitems],
+            format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/orders', {}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Order.objects.filter(user=user).latest('id')
+
+
+class QueryCountTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.menu = self.make_menu(20)
+
+    def queries(self, method, path, status, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(path, data, format='json')
+        self.assertEqual(response.status_code, status, path)
+        return len(queries)
+
+    def test_checkout_queries_do_not_grow_with_the_cart(self):
+        counts = []
+        for size in (1, 20):
+            customer = self.make_user(f'customer{size}')
+            self.login(customer)
+            self.assertEqual(self.client.post('/api/cart/menu-items/batch', [
+                {'menuitem': item.id, 'quantity': 2} for item in self.menu[:size]],
+                format='json').status_code, 201)
+            counts.append(self.queries('post', '/api/orders', 201, {}))
+            self.assertEqual(Order.objects.get(user=customer).orderitem_set.count(), size)
+        self.assertEqual(counts[0], counts[1])
+
+    def test_list_queries_do_not_grow_with_the_rows(self):
+        manager = self.make_user('manager', self.managers)
+        crew = self.make_user('crew', self.crew)
+        counts = []
+        for size in (1, 20):
+            customer = self.make_user(f'customer{size}')
+            self.login(customer)
+            self.client.post('/api/cart/menu-items/batch', [
+                {'menuitem': item.id, 'quantity': 1} for item in self.menu[:size]],
+                format='json')
+            count = [self.queries('get', '/api/cart/menu-items', 200)]
+            for _ in range(size):
+                Order.objects.create(user=customer, delivery_crew=crew,
+                                     total=Decimal(10), date=datetime.date.today())
+            for user in (customer, crew, manager):
+                self.login(user)
+                # Warms the token and role caches
+                self.client.get('/api/orders')
+                count.append(self.queries('get', '/api/orders', 200))
+            counts.append(count)
+        self.assertEqual(counts[0], counts[1])
+
+
+class ReplicaRoutingTests(LittleLemonTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('customer')
+        User.objects.using('replica').create(
+            id=self.customer.id, username=self.customer.username)
+        self.menu = self.make_menu(1)
+        today = datetime.date.today()
+        Order.objects.create(user=self.customer, total=Decimal(10), date=today)
+        # What the replica holds until the primary's order replicates
+        Order.objects.using('replica').create(
+            user_id=self.customer.id, total=Decimal(99), date=today)
+        self.enterContext(override_settings(DATABASE_REPLICAS=['replica']))
+        self.login(self.customer)
+
+    def totals(self):
+        response = self.client.get('/api/orders')
+        self.assertEqual(response.status_code, 200)
+        return [order['total'] for order in response.data['results']]
+
+    def test_list_reads_from_replica(self):
+        self.assertEqual(self.totals(), [Decimal('99.00')])
+
+    def test_menu_cache_is_filled_from_primary(self):
+        category = Category.objects.using('replica').create(
+            id=self.menu[0].Category_id, slug='mains', title='Mains')
+        MenuItem.objects.using('replica').create(
+            id=self.menu[0].id, title='Dish 0', price=Decimal(10), featured=False,
+            Category=category)
+        self.client.credentials()
+        for path in ('/api/menu-items', '/api/async/menu-items'):
+            etag = self.client.get(path)['ETag']
+            # Renamed on the primary; the replica lags behind
+            self.menu[0].title = f'Renamed for {path}'
+            self.menu[0].save()
+            response = self.client.get(path)
+            self.assertNotEqual(response['ETag'], etag)
+            self.assertEqual(response.json()['results'][0]['title'], self.menu[0].title)
+
+    def test_write_in_any_view_pins_to_primary(self):
+        # The cart batch view doesn't read from replicas itself
+        response = self.client.post('/api/cart/menu-items/batch',
+                                    [{'menuitem': self.menu[0].id, 'quantity': 1}],
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.totals(), [Decimal('10.00')])
+
+
+class MenuSearchTests(LittleLemonTestCase):
+    migration = importlib.import_module('LittleLemonAPI.migrations.0005_menuitem_search')
+
+    def search(self, terms):
+        search._available.clear()
+        response = self.client.get(f'/api/menu-items?search={terms}')
+        self.assertEqual(response.status_code, 200)
+        return sorted(item['title'] for item in response.json()['results'])
+
+    def test_migration_index_and_fallback(self):
+        self.addCleanup(search._available.clear)
+        self.make_menu(3)
+        schema_editor = mock.Mock(connection=connection)
+        self.migration.uninstall(None, schema_editor)
+        self.assertEqual(self.search('dish'), ['Dish 0', 'Dish 1', 'Dish 2'])
+        self.assertFalse(search.search_index_available('default'))
+        self.migration.install(None, schema_editor)
+        self.assertEqual(self.search('dish'), ['Dish 0', 'Dish 1', 'Dish 2'])
+        self.assertTrue(search.search_index_available('default'))
+        MenuItem.objects.create(title='Dish 3', price=1, featured=False,
+                                Category=Category.objects.get())
+        self.assertEqual(self.search('dish 3'), ['Dish 3'])
+
+    def test_migration_skips_other_backends(self):
+        schema_editor = mock.Mock()
+        schema_editor.connection.vendor = 'postgresql'
+        self.migration.install(None, schema_editor)
+        self.migration.uninstall(None, schema_editor)
+        schema_editor.connection.cursor.assert_not_called()
+
+
+class ExplainQueriesTests(LittleLemonTestCase):
+
+    def test_runs_with_system_checks_and_flags_unranked_search_sorts(self):
+        self.make_user('admin', is_superuser=True)
+        self.make_user('manager', self.managers)
+        crew = self.make_user('crew', self.crew)
+        customer = self.make_user('customer')
+        self.make_menu(3)
+        Order.objects.create(user=customer, delivery_crew=crew,
+                             total=Decimal(10), date=datetime.date.today())
+        out = io.StringIO()
+        call_command('explain_queries', '--warn-only', '--host', 'testserver',
+                     skip_checks=False, stdout=out)
+        report = out.getvalue().splitlines()
+        self.assertIn('ok   anon GET /api/menu-items?search=Dish (200, 2 selects)', report)
+        self.assertIn('FLAG anon GET /api/menu-items?search=Dish&ordering=price '
+                      '(200, 1 selects)', report)
+
+
+class MenuCacheTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.menu = self.make_menu(2)
+
+    def test_hits_and_304s_run_no_queries(self):
+        for path in ('/api/menu-items', '/api/category', '/api/async/menu-items'):
+            first = self.client.get(path)
+            self.assertEqual(first.status_code, 200)
+            with self.assertNumQueries(0):
+                response = self.client.get(path)
+            self.assertEqual((response.status_code, response['ETag']), (200, first['ETag']))
+            self.assertEqual(response.json(), first.json())
+            with self.assertNumQueries(0):
+                response = self.client.get(path, headers={'If-None-Match': first['ETag']})
+            self.assertEqual(response.status_code, 304)
+
+    def test_writes_change_the_etag(self):
+        etag = self.client.get('/api/menu-items')['ETag']
+        self.menu[0].title = 'Renamed'
+        self.menu[0].save()
+        response = self.client.get('/api/menu-items', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][0]['title'], 'Renamed')
+
+        etag = response['ETag']
+        self.menu[1].delete()
+        response = self.client.get('/api/menu-items', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+
+
+class SalesAnalyticsTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.manager = self.make_user('manager', self.managers)
+        self.customer = self.make_user('customer')
+        self.menu = self.make_menu(2)
+
+    def rollups(self):
+        # Summed over the shards
+        return (list(DailySales.objects.values_list('date').annotate(
+                    Sum('orders'), Sum('revenue')).order_by('date')),
+                list(DailyItemSales.objects.values_list('date', 'menuitem').annotate(
+                    Sum('quantity'), Sum('revenue')).order_by('date', 'menuitem')))
+
+    def test_top_must_be_from_1_to_100(self):
+        self.place_order(self.customer, *self.menu)
+        self.login(self.manager)
+        for top in ('-1', '0', '101', 'abc'):
+            response = self.client.get(f'/api/analytics/sales?top={top}')
+            self.assertEqual(response.status_code, 400, top)
+        response = self.client.get('/api/analytics/sales?top=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['top_items']), 1)
+
+    @mock.patch('LittleLemonAPI.rollups.SALES_ROLLUP_SHARDS', 2)
+    def test_orders_are_spread_over_shards(self):
+        orders = [self.place_order(self.customer, self.menu[0]) for _ in range(3)]
+        self.assertEqual(sorted(DailySales.objects.values_list('shard', 'orders')),
+                         sorted([(0, 2), (1, 1)] if orders[0].id % 2 == 0 else [(0, 1), (1, 2)]))
+        self.assertEqual(DailyItemSales.objects.count(), 2)
+        self.login(self.manager)
+        response = self.client.get('/api/analytics/sales')
+        self.assertEqual((response.data['orders'], response.data['revenue']),
+                         (3, Decimal('30.00')))
+        self.assertEqual([(day['orders'], day['revenue']) for day in response.data['days']],
+                         [(3, Decimal('30.00'))])
+        self.assertEqual([(item['quantity'], item['revenue'])
+                          for item in response.data['top_items']], [(3, Decimal('30.00'))])
+        rebuild_sales_rollups()
+        self.assertEqual(DailySales.objects.get().orders, 3)
+
+    def test_deletes_outside_the_api_update_rollups(self):
+        through_api = self.place_order(self.customer, *self.menu)
+        through_orm = self.place_order(self.customer, self.menu[0])
+        self.place_order(self.customer, self.menu[0])
+        self.login(self.manager)
+        response = self.client.delete(f'/api/orders/{through_api.id}')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.rollups()[0][0][1], 2)
+        # As the admin deletes
+        through_orm.delete()
+        self.assertEqual(self.rollups()[0][0][1], 1)
+        # Cascades from the user
+        self.customer.delete()
+        self.assertEqual(self.rollups(), (
+            [(datetime.date.today(), 0, Decimal(0))],
+            [(datetime.date.today(), self.menu[0].id, 0, Decimal(0)),
+             (datetime.date.today(), self.menu[1].id, 0, Decimal(0))]))
+
+    def test_archiving_keeps_sales_and_rebuild_agrees(self):
+        order = self.place_order(self.customer, *self.menu)
+        Order.objects.filter(id=order.id).update(
+            status=True, date=datetime.date.today() - datetime.timedelta(days=2))
+        rebuild_sales_rollups()
+        before = self.rollups()
+        self.assertEqual(before[0][0][1:], (1, Decimal('21.00')))
+        self.assertEqual(sum(archive_orders(days=1)), 1)
+        self.assertEqual(self.rollups(), before)
+        rebuild_sales_rollups()
+        self.assertEqual(self.rollups(), before)
+
+
+class OrderExportTests(LittleLemonTestCase):
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/orders/export{query}')
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in response.streaming_content]
+
+    def test_archived_orders_only_on_request(self):
+        manager = self.make_user('manager', self.managers)
+        customer = self.make_user('customer')
+        menu = self.make_menu(2)
+        old = self.place_order(customer, menu[0])
+        new = self.place_order(customer, menu[1])
+        Order.objects.filter(id=old.id).update(
+            status=True, date=datetime.date.today() - datetime.timedelta(days=2))
+        self.assertEqual(sum(archive_orders(days=1)), 1)
+
+        self.login(manager)
+        self.assertEqual([order['id'] for order in self.export()], [new.id])
+        orders = self.export('?archived=1')
+        self.assertEqual([order['id'] for order in orders], [old.id, new.id])
+        self.assertEqual(orders[0]['user'], 'customer')
+        self.assertEqual(orders[0]['items'][0]['menuitem'], 'Dish 0')
+        self.assertEqual([order['id'] for order in self.export('?archived=1&status=0')],
+                         [new.id])
+
+
+class MenuImportTests(LittleLemonTestCase):
+
+    def test_updates_existing_titles_and_creates_new_ones(self):
+        admin = self.make_user('admin', is_superuser=True)
+        dish = self.make_menu(1)[0]
+        self.login(admin)
+        response = self.client.post(
+            '/api/menu-items/import?type=json',
+            f'[{{"title": "{dish.title}", "price": "7.50", "featured": true, '
+            f'"Category_id": {dish.Category_id}}}, '
+            f'{{"title": "Soup", "price": "4", "featured": false, '
+            f'"Category_id": {dish.Category_id}}}]',
+            content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 1))
+        dish.refresh_from_db()
+        self.assertEqual((dish.price, dish.featured), (Decimal('7.50'), True))
+        self.assertTrue(MenuItem.objects.filter(title='Soup').exists())
+
+    def test_malformed_json_arrays_are_400(self):
+        self.login(self.make_user('admin', is_superuser=True))
+        dish = self.make_menu(1)[0]
+        row = f'{{"title": "Soup", "price": "4", "Category_id": {dish.Category_id}}}'
+        for body in (f'[{row}{row}]', f'[{row} {row}]', f'[,{row}]',
+                     f'[{row},,{row}]', f'[{row},]', f'[{row}'):
+            response = self.client.post('/api/menu-items/import?type=json',
+                                        body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+            # However the body is split into reads
+            with self.assertRaises(ParseError):
+                list(json_rows(io.BytesIO(body.encode()), chunk_size=7))
+        self.assertFalse(MenuItem.objects.filter(title='Soup').exists())
+
+
+class OrderPaginationTests(LittleLemonTestCase):
+
+    def test_pages_have_no_gaps_or_repeats_on_tied_dates(self):
+        customer = self.make_user('customer')
+        self.login(self.make_user('manager', self.managers))
+        today = datetime.date.today()
+        for i in range(23):
+            Order.objects.create(user=customer, total=Decimal(10),
+                                 date=today - datetime.timedelta(days=i % 3))
+        for query, key in (('', lambda order: (order.date, order.id)),
+                           ('?ordering=date', lambda order: (-order.date.toordinal(), -order.id))):
+            expected = [order.id for order in sorted(Order.objects.all(), key=key, reverse=True)]
+            pages, url = [], f'/api/orders{query}'
+            while url:
+                data = self.client.get(url).data
+                pages.append([order['id'] for order in data['results']])
+                url = data['next']
+            self.assertEqual([pk for page in pages for pk in page], expected, query)
+
+            # And back again from the last page
+            back = [pages[-1]]
+            url = data['previous']
+            while url:
+                data = self.client.get(url).data
+                back.insert(0, [order['id'] for order in data['results']])
+                url = data['previous']
+            self.assertEqual(back, pages, query)
+
+
+class CompiledSerializerTests(LittleLemonTestCase):
+
+    def test_output_matches_drf(self):
+        # Every serializer a CompiledListMixin view compiles, in full and
+        # trimmed to each single field, with a price needing its scale kept
+        self.make_menu(3)
+        MenuItem.objects.create(title='Soup', price=Decimal('7.50'), featured=True,
+                                Category=Category.objects.create(slug='soups', title='Soups'))
+        view_classes = {getattr(pattern.callback, 'view_class', None)
+                        for pattern in _patterns(get_resolver())}
+        serializer_classes = {view.serializer_class for view in view_classes
+                              if view and issubclass(view, CompiledListMixin)}
+        self.assertIn(MenuItemSerializer, serializer_classes)
+        self.assertIn(CategorySerializer, serializer_classes)
+
+        for serializer_class in serializer_classes:
+            queryset = serializer_class.Meta.model.objects.order_by('pk')
+            names = readable_fields(serializer_class)
+            for fields in [None, *[(name,) for name in names]]:
+                compiled = compile_serializer(serializer_class, fields)
+                expected = trim(serializer_class(queryset, many=True), fields).data
+                self.assertEqual(compiled.many(compiled.values(queryset)), expected,
+                                 (serializer_class.__name__, fields))
+
+    def test_list_responses_match_drf(self):
+        self.make_menu(3)
+        for url in ('/api/menu-items', '/api/category'):
+            compiled = self.client.get(url).json()
+            with override_settings(COMPILED_SERIALIZERS=False):
+                cache.clear()
+                self.assertEqual(self.client.get(url).json(), compiled, url)
+
+
+class SparseFieldsTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.make_menu(7)
+
+    def walk(self, url):
+        titles = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            data = response.json()
+            titles += [item['title'] for item in data['results']]
+            url = data['next']
+        return titles
+
+    def test_keyset_pages_with_fields(self):
+        everything = [f'Dish {i}' for i in range(7)]
+        for prefix in ('/api', '/api/async'):
+            for query, expected in (
+                    ('fields=title', everything),
+                    ('fields=title&ordering=-price', everything[::-1]),
+                    ('fields=title,price&ordering=title', everything),
+                    ('fields=title&search=Dish', everything)):
+                response = self.client.get(f'{prefix}/menu-items?{query}')
+                self.assertEqual(response.status_code, 200, query)
+                self.assertEqual(list(response.json()['results'][0]),
+                                 query.split('&')[0][len('fields='):].split(','))
+                titles = self.walk(f'{prefix}/menu-items?{query}')
+                self.assertEqual(sorted(titles), sorted(expected), query)
+                if 'search' not in query:
+                    self.assertEqual(titles, expected, query)
+
+    @override_settings(COMPILED_SERIALIZERS=False)
+    def test_keyset_pages_with_fields_uncompiled(self):
+        self.assertEqual(self.walk('/api/menu-items?fields=title&ordering=price'),
+                         [f'Dish {i}' for i in range(7)])
+
+
+class IdempotencyTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('customer')
+        self.menu = self.make_menu(1)
+        self.login(self.customer)
+
+    def post(self, path, data, key):
+        return self.client.post(path, data, format='json',
+                                headers={'Idempotency-Key': key})
+
+    def test_retry_is_replayed_not_rerun(self):
+        line = {'menuitem': self.menu[0].id, 'quantity': 2}
+        first = self.post('/api/cart/menu-items', line, 'add-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', first)
+        retry = self.post('/api/cart/menu-items', line, 'add-1')
+        self.assertEqual((retry.status_code, retry['Idempotent-Replayed']), (201, 'true'))
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Cart.objects.get(user=self.customer).quantity, 2)
+
+        self.assertEqual(self.post('/api/orders', {}, 'order-1').status_code, 201)
+        retry = self.post('/api/orders', {}, 'order-1')
+        self.assertEqual((retry.status_code, retry['Idempotent-Replayed']), (201, 'true'))
+        self.assertEqual(Order.objects.filter(user=self.customer).count(), 1)
+
+    def test_key_reused_with_another_body_is_422(self):
+        self.post('/api/cart/menu-items', {'menuitem': self.menu[0].id, 'quantity': 1}, 'add-1')
+        response = self.post('/api/cart/menu-items',
+                             {'menuitem': self.menu[0].id, 'quantity': 3}, 'add-1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Cart.objects.get(user=self.customer).quantity, 1)
+
+    def test_replay_keeps_response_headers(self):
+        line = {'menuitem': self.menu[0].id, 'quantity': 2}
+        with mock.patch.object(views.CartView, 'get_success_headers',
+                               return_value={'Location': '/api/cart/menu-items'}):
+            first = self.post('/api/cart/menu-items', line, 'add-1')
+        retry = self.post('/api/cart/menu-items', line, 'add-1')
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual((first['Location'], retry['Location']),
+                         ('/api/cart/menu-items',) * 2)
+        self.assertEqual(retry['Content-Type'], 'application/json')
+
+    def test_lock_taken_over_after_expiry_is_left_alone(self):
+        # The request outlives its lock, which another request then takes
+        create = views.CartView.create
+
+        def slow_create(view, request, *args, **kwargs):
+            response_key, lock_key = idempotency._keys(request, 'add-1')
+            cache.set(lock_key, 'other', None)
+            return create(view, request, *args, **kwargs)
+
+        with mock.patch.object(views.CartView, 'create', slow_create):
+            self.post('/api/cart/menu-items',
+                      {'menuitem': self.menu[0].id, 'quantity': 1}, 'add-1')
+        request = mock.Mock(user=self.customer, path='/api/cart/menu-items')
+        self.assertEqual(cache.get(idempotency._keys(request, 'add-1')[1]), 'other')
+
+
+class OrderAssignTests(LittleLemonTestCase):
+
+    def test_limit_must_be_positive(self):
+        manager = self.make_user('manager', self.managers)
+        crew = self.make_user('crew', self.crew)
+        customer = self.make_user('customer')
+        for _ in range(2):
+            Order.objects.create(user=customer, total=Decimal(10), date=datetime.date.today())
+        self.login(manager)
+        for limit in (-1, 0, 'abc', None):
+            response = self.client.post('/api/orders/assign', {'limit': limit}, format='json')
+            self.assertEqual(response.status_code, 400, limit)
+        response = self.client.post('/api/orders/assign', {'limit': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['assigned'], 1)
+        self.assertEqual(Order.objects.filter(delivery_crew=crew).count(), 1)
+
+
+class ThrottleTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.now = 1000.0
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(mock.patch.object(
+            throttling, '_store', SQLiteThrottleStore(f'{directory}/throttle.sqlite3')))
+        self.enterContext(mock.patch.object(
+            SimpleRateThrottle, 'THROTTLE_RATES', {'anon': '2/minute', 'user': '5/minute'}))
+        self.enterContext(mock.patch.object(
+            SimpleRateThrottle, 'timer', lambda throttle: self.now))
+
+    def statuses(self, count):
+        return [self.client.get('/api/category').status_code for _ in range(count)]
+
+    def test_burst_then_429(self):
+        self.assertEqual(self.statuses(3), [200, 200, 429])
+        response = self.client.get('/api/category')
+        # 2/minute refills a token every 30 seconds
+        self.assertEqual(response['Retry-After'], '30')
+
+    def test_refills_over_time(self):
+        self.assertEqual(self.statuses(3), [200, 200, 429])
+        self.now += 30
+        self.assertEqual(self.statuses(2), [200, 429])
+        self.now += 60
+        self.assertEqual(self.statuses(3), [200, 200, 429])
+
+    def test_users_and_anonymous_have_separate_buckets(self):
+        self.assertEqual(self.statuses(3), [200, 200, 429])
+        self.login(self.make_user('customer'))
+        self.assertEqual(self.statuses(6), [200] * 5 + [429])
+        self.login(self.make_user('other'))
+        self.assertEqual(self.statuses(1), [200])
+
+
+class CartBatchTests(LittleLemonTestCase):
+
+    def test_repeated_items_are_merged(self):
+        customer = self.make_user('customer')
+        dish = self.make_menu(1)[0]
+        self.login(customer)
+        for store in (DatabaseCartStore(), CacheCartStore()):
+            with mock.patch.object(carts, '_store', store):
+                self.client.delete('/api/cart/menu-items')
+                dish.price = Decimal(10)
+                dish.save()
+                response = self.client.post('/api/cart/menu-items/batch', [
+                    {'menuitem': dish.id, 'quantity': 1},
+                    {'menuitem': dish.id, 'quantity': 2}], format='json')
+                self.assertEqual(response.status_code, 201)
+                dish.price = Decimal(20)
+                dish.save()
+                self.client.post('/api/cart/menu-items/batch', [
+                    {'menuitem': dish.id, 'quantity': 1}], format='json')
+                # The new line is priced at the current price
+                line = self.client.get('/api/cart/menu-items').data['details']
+                self.assertEqual([(item['quantity'], item['unit_price'], item['price'])
+                                  for item in line],
+                                 [(4, Decimal('20.00'), Decimal('50.00'))], store)
+
+
+class CartStoreTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('customer')
+        self.menu = self.make_menu(3)
+
+    def test_take_keeps_lines_added_meanwhile(self):
+        store = DatabaseCartStore()
+        store.add(self.customer, [(self.menu[0].id, 1)])
+        with store.take(self.customer) as lines:
+            self.assertEqual([line[0] for line in lines], [self.menu[0].id])
+            store.add(self.customer, [(self.menu[1].id, 2)])
+        self.assertEqual(list(Cart.objects.filter(user=self.customer).values_list(
+            'menuitem_id', 'quantity')), [(self.menu[1].id, 2)])
+
+    def test_take_locks_without_of_where_unsupported(self):
+        # As on MariaDB, where select_for_update(of=...) is an error
+        store = DatabaseCartStore()
+        select_for_update = QuerySet.select_for_update
+        for supported, expected in ((True, ('self',)), (False, ())):
+            store.add(self.customer, [(self.menu[0].id, 1)])
+            with mock.patch.object(connection.features, 'has_select_for_update_of', supported), \
+                    mock.patch.object(QuerySet, 'select_for_update', autospec=True,
+                                      side_effect=select_for_update) as locked:
+                with store.take(self.customer) as lines:
+                    self.assertEqual(len(lines), 1)
+            self.assertEqual(locked.call_args.kwargs.get('of', ()), expected)
+
+    def test_lock_timeout_fails_and_leaves_holders_lock(self):
+        store = CacheCartStore(lock_timeout=0.05)
+        key = f'cart:lock:{self.customer.pk}'
+        cache.set(key, 'other holder', 60)
+        with self.assertRaises(CartBusy):
+            store.add(self.customer, [(self.menu[0].id, 1)])
+        self.assertEqual(cache.get(key), 'other holder')
+        # A holder whose lock expired and was taken over leaves it alone
+        cache.delete(key)
+        with store._lock(self.customer.pk):
+            cache.set(key, 'other holder', 60)
+        self.assertEqual(cache.get(key), 'other holder')
+
+    def test_busy_cart_is_409(self):
+        self.enterContext(mock.patch.object(
+            carts, '_store', CacheCartStore(lock_timeout=0.05)))
+        cache.set(f'cart:lock:{self.customer.pk}', 'other holder', 60)
+        self.login(self.customer)
+        response = self.client.post('/api/cart/menu-items/batch', [
+            {'menuitem': self.menu[0].id, 'quantity': 1}], format='json')
+        self.assertEqual(response.status_code, 409)
+
+    def test_flush_writes_each_changed_cart_once(self):
+        store = CacheCartStore(lock_timeout=0.05)
+        other = self.make_user('other')
+        store.add(self.customer, [(self.menu[0].id, 1)])
+        store.add(self.customer, [(self.menu[0].id, 1)])
+        store.add(other, [(self.menu[1].id, 3)])
+        # One log slot per cart, however often it changed
+        self.assertEqual(cache.get(CacheCartStore.DIRTY_SEQ), 2)
+        self.assertEqual(store.flush(), 2)
+        self.assertEqual(sorted(Cart.objects.values_list('user__username', 'quantity')),
+                         [('customer', 2), ('other', 3)])
+        self.assertEqual(store.flush(), 0)
+
+        # A cart locked by a request is logged again for the next flush
+        store.add(self.customer, [(self.menu[1].id, 1)])
+        cache.set(f'cart:lock:{self.customer.pk}', 'other holder', 60)
+        self.assertEqual(store.flush(), 0)
+        cache.delete(f'cart:lock:{self.customer.pk}')
+        self.assertEqual(store.flush(), 1)
+        self.assertEqual(Cart.objects.filter(user=self.customer).count(), 2)
+
+    def test_flush_waits_one_run_for_an_unwritten_slot(self):
+        store = CacheCartStore()
+        store.add(self.customer, [(self.menu[0].id, 1)])
+        # A slot taken by an add that hasn't written it yet
+        cache.incr(CacheCartStore.DIRTY_SEQ)
+        other = self.make_user('other')
+        store.add(other, [(self.menu[1].id, 1)])
+        self.assertEqual(store.flush(), 1)
+        self.assertEqual(store.flush(), 1)
+        self.assertEqual(store.flush(), 0)
+
+    def test_cache_store_checkout(self):
+        store = CacheCartStore()
+        self.enterContext(mock.patch.object(carts, '_store', store))
+        with self.captureOnCommitCallbacks(execute=True):
+            order = self.place_order(self.customer, *self.menu[:2])
+        self.assertEqual(order.total, Decimal(21))
+        self.assertEqual(store.items(self.customer), [])
+        self.assertFalse(Cart.objects.filter(user=self.customer).exists())
+
+
+class TokenCacheTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('customer')
+        self.login(self.customer)
+
+    def test_cached_token_costs_no_queries(self):
+        self.assertEqual(self.client.get('/api/cart/menu-items').status_code, 404)
+        # Just the cart query
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/cart/menu-items').status_code, 404)
+
+    def test_logout_revokes_cached_token(self):
+        self.assertEqual(self.client.get('/api/cart/menu-items').status_code, 404)
+        self.assertEqual(self.client.post('/api/token/logout/').status_code, 204)
+        self.assertEqual(self.client.get('/api/cart/menu-items').status_code, 401)
+
+    def test_deactivation_revokes_cached_token(self):
+        self.assertEqual(self.client.get('/api/cart/menu-items').status_code, 404)
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertEqual(self.client.get('/api/cart/menu-items').status_code, 401)
+
+
+class RoleCacheTests(LittleLemonTestCase):
+
+    def status(self, user):
+        self.login(user)
+        return self.client.get('/api/groups/delivery-crew/users').status_code
+
+    def test_group_changes_outside_the_api_apply_at_once(self):
+        user = self.make_user('alice')
+        self.assertEqual(self.status(user), 403)
+        for change, expected in (
+                (lambda: user.groups.add(self.managers), 200),
+                (lambda: user.groups.remove(self.managers), 403),
+                (lambda: self.managers.user_set.add(user), 200),
+                (lambda: self.managers.user_set.clear(), 403),
+                (lambda: self.managers.user_set.add(user), 200),
+                (lambda: user.groups.clear(), 403),
+                (lambda: self.managers.user_set.add(user), 200),
+                (lambda: self.managers.delete(), 403)):
+            change()
+            self.assertEqual(self.status(user), expected)
+
+
+class StaffUserDetailTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = self.make_user('admin', is_superuser=True)
+        self.manager = self.make_user('manager', self.managers)
+        self.rider = self.make_user('rider', self.crew)
+        self.customer = self.make_user('customer')
+
+    def get(self, user, path):
+        self.login(user)
+        return self.client.get(path)
+
+    def test_manager_detail_is_for_superusers(self):
+        path = f'/api/groups/manager/users/{self.manager.id}'
+        for user in (self.customer, self.rider, self.manager):
+            self.assertEqual(self.get(user, path).status_code, 403, user)
+        response = self.get(self.admin, path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'manager')
+
+    def test_delivery_crew_detail_is_for_managers(self):
+        path = f'/api/groups/delivery-crew/users/{self.rider.id}'
+        for user in (self.customer, self.rider):
+            self.assertEqual(self.get(user, path).status_code, 403, user)
+        for user in (self.manager, self.admin):
+            self.assertEqual(self.get(user, path).status_code, 200, user)
+
+
+class LazyRendererTests(LittleLemonTestCase):
+
+    def test_json_requests_load_no_other_renderer(self):
+        self.enterContext(mock.patch.object(XMLRenderer, '_renderer', None))
+        self.enterContext(mock.patch.object(BrowsableAPIRenderer, '_renderer', None))
+        self.assertEqual(self.client.get('/api/category').status_code, 200)
+        self.assertIsNone(XMLRenderer._renderer)
+        self.assertIsNone(BrowsableAPIRenderer._renderer)
+        response = self.client.get('/api/category?format=xml')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b'<?xml'))
+        self.assertIsNotNone(XMLRenderer._renderer)
+        response = self.client.get('/api/category', HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(BrowsableAPIRenderer._renderer)
+
+
+class AsyncViewTests(LittleLemonTestCase):
+
+    async def test_throttles_run_off_the_event_loop(self):
+        threads = []
+
+        def allow_request(throttle, request, view):
+            threads.append(threading.get_ident())
+            return len(threads) < 2
+
+        with mock.patch.object(AnonThrottle, 'allow_request', allow_request), \
+                mock.patch.object(AnonThrottle, 'wait', lambda throttle: 7):
+            response = await self.async_client.get('/api/async/category')
+            self.assertEqual(response.status_code, 200)
+            response = await self.async_client.get('/api/async/category')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('7 seconds', response.json()['detail'])
+        self.assertNotIn(threading.get_ident(), threads)
+
+
+class OrderEventsTests(LittleLemonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.customer = self.make_user('customer')
+        other = self.make_user('other')
+        today = datetime.date.today()
+        self.order = Order.objects.create(user=self.customer, total=Decimal(10), date=today)
+        self.others = Order.objects.create(user=other, total=Decimal(10), date=today)
+        self.login(self.customer)
+        self.broker = InProcessBroker()
+        self.enterContext(mock.patch.object(events, '_broker', self.broker))
+
+    def test_wsgi_long_poll_times_out(self):
+        with mock.patch.object(async_views, 'ORDER_EVENTS_POLL_TIMEOUT', 0.1):
+            response = self.client.get('/api/orders/events')
+        self.assertEqual(response.status_code, 204)
+
+    def test_wsgi_long_poll_timeout_param(self):
+        self.assertEqual(self.client.get('/api/orders/events?timeout=0').status_code, 204)
+        for timeout in ('-1', str(ORDER_EVENTS_POLL_TIMEOUT + 1), 'abc'):
+            response = self.client.get(f'/api/orders/events?timeout={timeout}')
+            self.assertEqual(response.status_code, 400, timeout)
+
+    def test_wsgi_long_poll_returns_next_visible_event(self):
+        def publish():
+            get_broker().publish(order_event('updated', self.others))
+            get_broker().publish(order_event('updated', self.order))
+        timer = threading.Timer(0.5, publish)
+        timer.start()
+        self.addCleanup(timer.cancel)
+        with mock.patch.object(async_views, 'ORDER_EVENTS_POLL_TIMEOUT', 5):
+            response = self.client.get('/api/orders/events')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['event'], response.json()['order']['id']),
+                         ('updated', self.order.id))
+
+    def test_long_poll_resumes_after_an_event_id(self):
+        for order in (self.order, self.others, self.order):
+            self.broker.publish(order_event('updated', order))
+        first, _, third = [event['id'] for event in self.broker.replay]
+        response = self.client.get(f'/api/orders/events?timeout=0&since={first}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], third)
+        response = self.client.get(f'/api/orders/events?timeout=0&since={third}')
+        self.assertEqual(response.status_code, 204)
+
+    def test_resuming_from_a_dropped_event_resets(self):
+        self.broker = InProcessBroker(replay_size=2)
+        self.enterContext(mock.patch.object(events, '_broker', self.broker))
+        for _ in range(3):
+            self.broker.publish(order_event('updated', self.order))
+        for since in ('1', 'junk'):
+            response = self.client.get(f'/api/orders/events?timeout=0&since={since}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {'id': self.broker.replay[-1]['id'],
+                                               'event': 'reset', 'order': None})
+
+    def test_checkout_publishes_created(self):
+        menu = self.make_menu(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = self.place_order(self.customer, *menu)
+        self.assertEqual([(event['event'], event['order']['id']) for event in self.broker.replay],
+                         [('created', order.id)])
+
+    def test_in_process_broker_with_several_workers_warns(self):
+        self.assertEqual(check_event_broker(None), [])
+        with override_settings(WEB_CONCURRENCY=2):
+            self.assertEqual([warning.id for warning in check_event_broker(None)],
+                             ['LittleLemonAPI.W002'])
+
+    async def test_asgi_stream_replays_after_last_event_id(self):
+        for order in (self.order, self.order):
+            self.broker.publish(order_event('updated', order))
+        first, second = [event['id'] for event in self.broker.replay]
+        response = await self.async_client.get(
+            '/api/orders/events', headers={'Authorization': f'Token {self.customer.token}',
+                                           'Last-Event-ID': str(first)})
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b': connected\n\n')
+        self.assertTrue((await anext(chunks)).startswith(
+            f'id: {second}\nevent: updated\n'.encode()))
+        await chunks.aclose()
+
+    async def test_asgi_streams(self):
+        response = await self.async_client.get(
+            '/api/orders/events', headers={'Authorization': f'Token {self.customer.token}'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = aiter(response.streaming_content)
+        self.assertEqual(await anext(chunks), b': connected\n\n')
@@ -0,0 +1,142 @@
+import random
+import sqlite3
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+
+# Token-bucket throttling with a fixed-size state per key (tokens left and
+# when they were last topped up), kept in a store shared by every worker so
+# limits hold across processes. Each check is one atomic operation on the
+# store. DRF's own throttles keep a list of timestamps per key in the
+# per-process cache instead.
+
+
+class SQLiteThrottleStore:
+    # A file-backed store for workers on one host
+
+    # Drop fully refilled buckets every so often; a missing row is a full one
+    PRUNE_EVERY = 1000
+
+    CONSUME = '''
+        INSERT INTO throttle (key, tokens, stamp, allowed)
+        VALUES (:key, :capacity - 1, :now, 1)
+        ON CONFLICT (key) DO UPDATE SET
+            tokens = MIN(:capacity, tokens + (:now - stamp) * :rate)
+                     - (MIN(:capacity, tokens + (:now - stamp) * :rate) >= 1),
+            allowed = MIN(:capacity, tokens + (:now - stamp) * :rate) >= 1,
+            stamp = :now
+        RETURNING tokens, allowed
+    '''
+
+    def __init__(self, path):
+        if sqlite3.sqlite_version_info < (3, 35):
+            raise ImproperlyConfigured(
+                'SQLiteThrottleStore needs SQLite 3.35+ for RETURNING')
+        self.path = str(path)
+        self.local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS throttle ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, '
+                'stamp REAL NOT NULL, allowed INTEGER NOT NULL)')
+            self.local.connection = connection
+        return connection
+
+    def consume(self, key, capacity, rate, now):
+        tokens, allowed = self.connection.execute(self.CONSUME, {
+            'key': key, 'capacity': capacity, 'rate': rate, 'now': now,
+        }).fetchone()
+        if random.randrange(self.PRUNE_EVERY) == 0:
+            self.prune(capacity, rate, now)
+        return bool(allowed), tokens
+
+    def prune(self, capacity, rate, now):
+        self.connection.execute(
+            'DELETE FROM throttle WHERE stamp < ?', (now - capacity / rate,))
+
+
+class RedisThrottleStore:
+    # A store shared across hosts; needs the optional `redis` package
+
+    CONSUME = '''
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+        local tokens = tonumber(state[1]) or capacity
+        local stamp = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + (now - stamp) * rate)
+        local allowed = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'stamp', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate))
+        return {allowed, tostring(tokens)}
+    '''
+
+    def __init__(self, url, prefix='throttle:'):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured(
+                'RedisThrottleStore needs the redis package installed')
+        self.prefix = prefix
+        self.script = redis.Redis.from_url(url).register_script(self.CONSUME)
+
+    def consume(self, key, capacity, rate, now):
+        allowed, tokens = self.script(
+            keys=[self.prefix + key], args=[capacity, rate, now])
+        return bool(allowed), float(tokens)
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        config = settings.THROTTLE_STORE
+        _store = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _store
+
+
+class TokenBucketMixin:
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        # num_requests per duration seconds, allowed to burst to num_requests
+        rate = self.num_requests / self.duration
+        allowed, self.tokens = get_store().consume(
+            self.key, self.num_requests, rate, self.timer())
+        self.refill_rate = rate
+        return allowed
+
+    def wait(self):
+        return (1 - self.tokens) / self.refill_rate
+
+
+class AnonThrottle(TokenBucketMixin, AnonRateThrottle):
+    pass
+
+
+class UserThrottle(TokenBucketMixin, UserRateThrottle):
+    pass
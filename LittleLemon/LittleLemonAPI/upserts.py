@@ -0,0 +1,48 @@
+from django.db import connections, router
+
+
+def bulk_upsert_add(model, rows, unique_fields, add_fields, set_fields=()):
+    # Insert `rows` (dicts of column values), or, where a row with the same
+    # `unique_fields` exists, add the new values of `add_fields` to it and
+    # overwrite `set_fields`. One statement whatever the number of rows.
+    # Django's bulk_create(update_conflicts=True) can only overwrite, not add.
+    if not rows:
+        return
+    alias = router.db_for_write(model)
+    connection = connections[alias]
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    columns = list(rows[0])
+    column_sql = [qn(model._meta.get_field(name).column) for name in columns]
+
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    params = []
+    for row in rows:
+        for name in columns:
+            field = model._meta.get_field(name)
+            params.append(field.get_db_prep_save(row[name], connection))
+
+    if connection.vendor == 'mysql':
+        def new(column):
+            return f'VALUES({column})'
+        conflict = 'ON DUPLICATE KEY UPDATE'
+    else:
+        def new(column):
+            return f'EXCLUDED.{column}'
+        target = ', '.join(qn(model._meta.get_field(name).column)
+                           for name in unique_fields)
+        conflict = f'ON CONFLICT ({target}) DO UPDATE SET'
+
+    updates = []
+    for name in add_fields:
+        column = qn(model._meta.get_field(name).column)
+        updates.append(f'{column} = {table}.{column} + {new(column)}')
+    for name in set_fields:
+        column = qn(model._meta.get_field(name).column)
+        updates.append(f'{column} = {new(column)}')
+
+    sql = (f'INSERT INTO {table} ({", ".join(column_sql)}) '
+           f'VALUES {", ".join([placeholders] * len(rows))} '
+           f'{conflict} {", ".join(updates)}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
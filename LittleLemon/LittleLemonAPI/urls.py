@@ -1,11 +1,12 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 from rest_framework.authtoken.views import obtain_auth_token
 
 
 urlpatterns = [
     path('category', views.CategoriesView.as_view()),
     path('menu-items', views.MenuItemsView.as_view()),
+    path('menu-items/import', views.MenuItemImportView.as_view()),
     path('menu-items/<int:pk>', views.SingleMenuItemsView.as_view()),
     path('groups/manager/users', views.ManagerView.as_view()),
     path('groups/manager/users/<int:pk>', views.DeleteManagerView.as_view()),
@@ -13,6 +14,19 @@ urlpatterns = [
     path('groups/delivery-crew/users/<int:pk>',
          views.DeleteDeliveryCrewView.as_view()),
     path('cart/menu-items', views.CartView.as_view()),
+    path('cart/menu-items/batch', views.CartBatchView.as_view()),
     path('orders', views.OrderView.as_view()),
+    path('orders/export', views.OrderExportView.as_view()),
+    path('orders/assign', views.OrderAssignView.as_view()),
+    # Push channel for order changes; serve under asgi.py (a long poll
+    # under wsgi.py)
+    path('orders/events', async_views.OrderEventsView.as_view()),
     path('orders/<int:pk>', views.ModifyOrderView.as_view()),
+    path('analytics/sales', views.SalesAnalyticsView.as_view()),
+    # Async read paths, for serving (and benchmarking) under asgi.py
+    path('async/category', async_views.CategoriesView.as_view()),
+    path('async/menu-items', async_views.MenuItemsView.as_view()),
+    path('async/menu-items/<int:pk>', async_views.SingleMenuItemsView.as_view()),
+    path('async/cart/menu-items', async_views.CartView.as_view()),
+    path('async/orders', async_views.OrderView.as_view()),
 ]
@@ -2,22 +2,44 @@ from django.shortcuts import render, get_object_or_404
 
 # Create your views here.
 from rest_framework import generics
-from .models import MenuItem, Category, Cart, Order, OrderItem
-from .serializers import MenuItemSerializer, CategorySerializer, UserGroupSerializer, CartSerializer, AdminOrderSerializer, CrewOrderSerializer, CustomerOrderSerializer
+from .models import MenuItem, Category, Cart, Order, OrderItem, DailySales, DailyItemSales, ArchivedOrder
+from .serializers import MenuItemSerializer, CategorySerializer, UserGroupSerializer, CartSerializer, CartLineSerializer, AdminOrderSerializer, CrewOrderSerializer, CustomerOrderSerializer
 from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
-from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+from .throttling import AnonThrottle, UserThrottle
 from rest_framework.pagination import PageNumberPagination
+from .pagination import MenuItemPagination, OrderPagination
+from rest_framework.filters import OrderingFilter
+from django_filters.rest_framework import DjangoFilterBackend
+from .search import MenuSearchFilter
 from django.contrib.auth.models import User, Group
 from django.core.exceptions import ObjectDoesNotExist
 from rest_framework.views import APIView
-
-
-class CategoriesView(generics.ListCreateAPIView):
-    queryset = Category.objects.all()
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from .exports import EXPORT_FORMATS, iter_archived_orders, iter_orders, merge_orders
+from .imports import IMPORT_FORMATS, import_menu_items
+from .carts import CART_FIELDS, add_to_cart, get_cart_store
+from .dispatch import DISPATCH_BATCH_SIZE, assign_deliveries
+from .events import publish_order
+from .archive import add_usernames, archived_orders
+from django.db import transaction
+from django.db.models import Sum
+import datetime
+from decimal import Decimal
+from .roles import MANAGER, DELIVERY_CREW, is_manager, is_delivery_crew
+from .caching import MenuCacheMixin
+from .compiled import CompiledListMixin
+from .routers import ReplicaReadMixin
+from .idempotency import IdempotencyMixin
+from .sparse import SparseFieldsMixin, requested_fields
+
+
+class CategoriesView(MenuCacheMixin, CompiledListMixin, SparseFieldsMixin, generics.ListCreateAPIView):
+    queryset = Category.objects.order_by('id')
     serializer_class = CategorySerializer
-    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    throttle_classes = [AnonThrottle, UserThrottle]
 
     def post(self, request, *args, **kwargs):
         user = request.user
@@ -27,12 +49,14 @@ class CategoriesView(generics.ListCreateAPIView):
             return Response(f'403 - Unauthorized', status=403)
 
 
-class MenuItemsView(generics.ListCreateAPIView):
+class MenuItemsView(MenuCacheMixin, CompiledListMixin, SparseFieldsMixin, generics.ListCreateAPIView):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
-    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    throttle_classes = [AnonThrottle, UserThrottle]
     ordering_fields = ['price', 'title']
     search_fields = ['title']
+    filter_backends = [DjangoFilterBackend, OrderingFilter, MenuSearchFilter]
+    pagination_class = MenuItemPagination
     filterset_fields = ['Category',]
 
     def post(self, request, *args, **kwargs):
@@ -43,22 +67,44 @@ class MenuItemsView(generics.ListCreateAPIView):
             return Response(f'403 - Unauthorized', status=403)
 
 
-class SingleMenuItemsView(generics.RetrieveUpdateDestroyAPIView):
+class MenuItemImportView(APIView):
+    throttle_classes = [AnonThrottle, UserThrottle]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        user = request.user
+        if not user.is_superuser:
+            return Response(f'403 - Unauthorized', status=403)
+
+        import_type = request.query_params.get('type', 'json')
+        if import_type not in IMPORT_FORMATS:
+            return Response("field : 'type' must be 'json' or 'csv'", status=400)
+
+        # Rows are read straight off the request body, never via request.data
+        rows = IMPORT_FORMATS[import_type](request.stream)
+        result = import_menu_items(rows)
+        imported = result['created'] or result['updated']
+        if result['errors'] and not imported:
+            return Response(result, status=400)
+        return Response(result)
+
+
+class SingleMenuItemsView(MenuCacheMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
-    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    throttle_classes = [AnonThrottle, UserThrottle]
     permission_classes = [IsAuthenticated]
 
     def put(self, request, *args, **kwargs):
         user = request.user
-        if user.groups.filter(name='Manager').exists() or user.is_superuser:
+        if is_manager(user):
             return super().put(request, *args, **kwargs)
         else:
             return Response(f'403 - Unauthorized', status=403)
 
     def patch(self, request, *args, **kwargs):
         user = request.user
-        if user.groups.filter(name='Manager').exists() or user.is_superuser:
+        if is_manager(user):
             return super().patch(request, *args, **kwargs)
         else:
             return Response(f'403 - Unauthorized', status=403)
@@ -72,11 +118,10 @@ class SingleMenuItemsView(generics.RetrieveUpdateDestroyAPIView):
 
 
 class ManagerView(generics.ListCreateAPIView):
-    users = User.objects.filter(groups__name='Manager')
-    queryset = [{'username': user.username,
-                 'email': user.email} for user in users]
+    # Lazy, so importing the URLconf runs no query
+    queryset = User.objects.filter(groups__name=MANAGER)
     permission_classes = [IsAuthenticated]
-    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    throttle_classes = [AnonThrottle, UserThrottle]
     serializer_class = UserGroupSerializer
 
     def get(self, request, *args, **kwargs):
@@ -105,13 +150,18 @@ class ManagerView(generics.ListCreateAPIView):
 
 
 class DeleteManagerView(generics.RetrieveDestroyAPIView):
-    users = User.objects.filter(groups__name='Manager')
-    queryset = [{'username': user.username,
-                 'password': user.password,
-                 'email': user.email} for user in users]
+    # Lazy, so importing the URLconf runs no query
+    queryset = User.objects.filter(groups__name=MANAGER)
     permission_classes = [IsAuthenticated]
     serializer_class = UserGroupSerializer
 
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        if user.is_superuser:
+            return super().get(request, *args, **kwargs)
+        else:
+            return Response(f'403 - Unauthorized', status=403)
+
     def delete(self, request, *args, **kwargs):
         user = request.user
         if user.is_superuser:
@@ -139,16 +189,15 @@ class DeleteManagerView(generics.RetrieveDestroyAPIView):
 
 
 class DeliveryCrewView(generics.ListCreateAPIView):
-    users = User.objects.filter(groups__name='Delivery crew')
-    queryset = [{'username': user.username,
-                 'email': user.email} for user in users]
+    # Lazy, so importing the URLconf runs no query
+    queryset = User.objects.filter(groups__name=DELIVERY_CREW)
     permission_classes = [IsAuthenticated]
-    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    throttle_classes = [AnonThrottle, UserThrottle]
     serializer_class = UserGroupSerializer
 
     def get(self, request, *args, **kwargs):
         user = request.user
-        if user.groups.filter(name='Manager').exists() or user.is_superuser:
+        if is_manager(user):
             users = User.objects.filter(groups__name='Delivery crew')
             queryset = [{'username': user.username,
                          'email': user.email} for user in users]
@@ -158,7 +207,7 @@ class DeliveryCrewView(generics.ListCreateAPIView):
 
     def post(self, request, *args, **kwargs):
         user = request.user
-        if user.groups.filter(name='Manager').exists() or user.is_superuser:
+        if is_manager(user):
             username = request.data['username']
             if username:
                 user = get_object_or_404(User, username=username)
@@ -172,16 +221,21 @@ class DeliveryCrewView(generics.ListCreateAPIView):
 
 
 class DeleteDeliveryCrewView(generics.RetrieveDestroyAPIView):
-    users = User.objects.filter(groups__name='Delivery crew')
-    queryset = [{'username': user.username,
-                 'password': user.password,
-                 'email': user.email} for user in users]
+    # Lazy, so importing the URLconf runs no query
+    queryset = User.objects.filter(groups__name=DELIVERY_CREW)
     permission_classes = [IsAuthenticated]
     serializer_class = UserGroupSerializer
 
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        if is_manager(user):
+            return super().get(request, *args, **kwargs)
+        else:
+            return Response(f'403 - Unauthorized', status=403)
+
     def delete(self, request, *args, **kwargs):
         user = request.user
-        if user.groups.filter(name='Manager').exists() or user.is_superuser:
+        if is_manager(user):
             lookup_url_kwarg = self.lookup_field
 
             assert lookup_url_kwarg in self.kwargs, (
@@ -205,10 +259,10 @@ class DeleteDeliveryCrewView(generics.RetrieveDestroyAPIView):
             return Response(f'403 - Unauthorized', status=403)
 
 
-class CartView(generics.ListCreateAPIView, generics.DestroyAPIView):
+class CartView(IdempotencyMixin, generics.ListCreateAPIView, generics.DestroyAPIView):
     queryset = Cart.objects.all()
     serializer_class = CartSerializer
-    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    throttle_classes = [AnonThrottle, UserThrottle]
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
@@ -217,59 +271,90 @@ class CartView(generics.ListCreateAPIView, generics.DestroyAPIView):
 
     def get(self, request, *args, **kwargs):
         user = request.user
-        try:
-            useritems = Cart.objects.filter(user=user.id).all()
-        except ObjectDoesNotExist:
-            useritems = None
-        if useritems:
-            queryset = [{'id': useritem.id,
-                         'menuitem': str(useritem.menuitem),
-                         'quantity': useritem.quantity,
-                         'unit_price': useritem.unit_price,
-                         'price': useritem.price,
-                         'user': str(useritem.user)} for useritem in useritems]
+        fields = requested_fields(request.query_params, CART_FIELDS) or CART_FIELDS
+        queryset = get_cart_store().items(user, fields)
+        if queryset:
             return Response({'details': queryset})
         else:
             return Response('404 - Not found', status=404)
 
     def delete(self, request, *args, **kwargs):
         user = request.user
-        Cart.objects.filter(user=user).delete()
+        get_cart_store().clear(user)
         return Response('200 - success', status=200)
 
 
-class OrderView(generics.ListCreateAPIView):
+class CartBatchView(APIView):
+    throttle_classes = [AnonThrottle, UserThrottle]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        user = request.user
+        serializer = CartLineSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        if not serializer.validated_data:
+            return Response("body : at least one menu item required", status=400)
+        rows = add_to_cart(user, [(line['menuitem'], line['quantity'])
+                                  for line in serializer.validated_data])
+        if rows is None:
+            return Response("field : 'menuitem' not found", status=404)
+        queryset = [{'menuitem': row['menuitem'],
+                     'quantity': row['quantity'],
+                     'unit_price': row['unit_price'],
+                     'price': row['price']} for row in rows]
+        return Response({'details': queryset}, status=201)
+
+
+# OrderView.get's response fields, and the columns they are read from
+ORDER_COLUMNS = {
+    'id': 'id',
+    'user': 'user__username',
+    'status': 'status',
+    'total': 'total',
+    'date': 'date',
+}
+ORDER_FIELDS = tuple(ORDER_COLUMNS)
+
+
+class OrderView(IdempotencyMixin, ReplicaReadMixin, generics.ListCreateAPIView):
     queryset = Order.objects.all()
-    throttle_classes = [AnonRateThrottle, UserRateThrottle]
+    throttle_classes = [AnonThrottle, UserThrottle]
     permission_classes = [IsAuthenticated]
+    ordering_fields = ['date']
+    pagination_class = OrderPagination
 
     def get_serializer_class(self):
         user = self.request.user
-        if user.groups.filter(name='Manager').exists() or user.is_superuser:
+        if is_manager(user):
             return AdminOrderSerializer
-        elif user.groups.filter(name='Delivery crew').exists():
+        elif is_delivery_crew(user):
             return CrewOrderSerializer
         return CustomerOrderSerializer
 
     def get(self, request, *args, **kwargs):
         user = request.user
-        try:
-            user = request.user
-            if user.groups.filter(name='Manager').exists() or user.is_superuser:
-                orders = Order.objects.all()
-            elif user.groups.filter(name='Delivery crew').exists():
-                orders = Order.objects.filter(delivery_crew=user).all()
-            else:
-                orders = Order.objects.filter(user=user).all()
-        except ObjectDoesNotExist:
-            orders = None
-        if orders:
-            queryset = [{'id': order.id,
-                         'user': str(order.user),
-                         'status': order.status,
-                         'total': order.total,
-                         'date': order.date, } for order in orders]
-            return Response({'details': queryset})
+        if is_manager(user):
+            orders = Order.objects.all()
+        elif is_delivery_crew(user):
+            orders = Order.objects.filter(delivery_crew=user)
+        else:
+            orders = Order.objects.filter(user=user)
+        fields = requested_fields(request.query_params, ORDER_FIELDS) or ORDER_FIELDS
+        # One joined query; only the columns the response needs, plus the
+        # (date, id) keyset the pages are cut on
+        columns = dict.fromkeys([ORDER_COLUMNS[field] for field in fields] + ['date', 'id'])
+        orders = orders.values(*columns)
+        if request.query_params.get('archived', '').lower() in ('1', 'true'):
+            # Opt in to spanning the archived history as well
+            orders = self.paginator.paginate_querysets(
+                [orders, archived_orders(user, columns)], request, self)
+            add_usernames(orders)
+        else:
+            orders = self.paginate_queryset(orders)
+        if orders or self.paginator.cursor is not None:
+            queryset = [{field: order[ORDER_COLUMNS[field]] for field in fields}
+                        for order in orders]
+            return self.get_paginated_response(queryset)
         else:
             return Response('404 - Not found', status=404)
 
@@ -278,35 +363,181 @@ class OrderView(generics.ListCreateAPIView):
         serializer.save(user=self.request.user)
 
 
+class OrderExportView(APIView):
+    # Streams orders, with their lines, oldest first. ?type=ndjson|csv,
+    # ?from= and ?to= dates, ?status=0|1. Orders moved to the archive by
+    # archive_orders are left out unless ?archived=1.
+    throttle_classes = [AnonThrottle, UserThrottle]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        if not is_manager(user):
+            return Response(f'403 - Unauthorized', status=403)
+
+        export_type = request.query_params.get('type', 'ndjson')
+        if export_type not in EXPORT_FORMATS:
+            return Response("field : 'type' must be 'ndjson' or 'csv'", status=400)
+
+        filters = {}
+        for param, lookup in (('from', 'date__gte'), ('to', 'date__lte')):
+            if param in request.query_params:
+                try:
+                    date = parse_date(request.query_params[param])
+                except ValueError:
+                    date = None
+                if date is None:
+                    return Response(f"field : '{param}' must be YYYY-MM-DD", status=400)
+                filters[lookup] = date
+        if 'status' in request.query_params:
+            status = request.query_params['status'].lower()
+            if status not in ('0', '1', 'true', 'false'):
+                return Response("field : 'status' must be 0 or 1", status=400)
+            filters['status'] = status in ('1', 'true')
+
+        orders = iter_orders(Order.objects.filter(**filters))
+        if request.query_params.get('archived', '').lower() in ('1', 'true'):
+            orders = merge_orders(orders, iter_archived_orders(
+                ArchivedOrder.objects.filter(**filters)))
+        lines, content_type = EXPORT_FORMATS[export_type]
+        response = StreamingHttpResponse(
+            lines(orders), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_type}"'
+        return response
+
+
+class OrderAssignView(APIView):
+    throttle_classes = [AnonThrottle, UserThrottle]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        user = request.user
+        if not is_manager(user):
+            return Response(f'403 - Unauthorized', status=403)
+
+        try:
+            limit = int(request.data.get('limit', DISPATCH_BATCH_SIZE))
+        except (TypeError, ValueError):
+            limit = None
+        if limit is None or limit < 1:
+            return Response("field : 'limit' must be a positive number", status=400)
+        limit = min(limit, DISPATCH_BATCH_SIZE)
+
+        assignments = assign_deliveries(limit)
+        crew = User.objects.filter(id__in=list(assignments)).values('id', 'username')
+        queryset = [{'id': member['id'],
+                     'username': member['username'],
+                     'orders': assignments[member['id']]} for member in crew]
+        return Response({'assigned': sum(map(len, assignments.values())),
+                         'details': queryset})
+
+
 class ModifyOrderView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Order.objects.all()
     permission_classes = [IsAuthenticated]
 
     def get_serializer_class(self):
         user = self.request.user
-        if user.groups.filter(name='Manager').exists() or user.is_superuser:
+        if is_manager(user):
             return AdminOrderSerializer
-        elif user.groups.filter(name='Delivery crew').exists():
+        elif is_delivery_crew(user):
             return CrewOrderSerializer
         return CustomerOrderSerializer
 
     def put(self, request, *args, **kwargs):
         user = request.user
-        if user.groups.filter(name='Manager').exists() or user.is_superuser:
+        if is_manager(user):
             return super().put(request, *args, **kwargs)
         else:
             return Response(f'403 - Unauthorized', status=403)
 
     def patch(self, request, *args, **kwargs):
         user = request.user
-        if user.groups.filter(name='Manager').exists() or user.is_superuser:
+        if is_manager(user):
             return super().patch(request, *args, **kwargs)
         else:
             return Response(f'403 - Unauthorized', status=403)
 
     def delete(self, request, *args, **kwargs):
         user = request.user
-        if user.groups.filter(name='Manager').exists() or user.is_superuser:
+        if is_manager(user):
             return super().delete(request, *args, **kwargs)
         else:
             return Response(f'403 - Unauthorized', status=403)
+
+    def perform_update(self, serializer):
+        previous_crew = serializer.instance.delivery_crew_id
+        with transaction.atomic():
+            order = serializer.save()
+            publish_order('updated', order, previous_crew)
+
+    def perform_destroy(self, instance):
+        # The sales rollups are updated by the pre_delete signal
+        with transaction.atomic():
+            publish_order('deleted', instance)
+            instance.delete()
+
+
+def _money(value):
+    # Sums over DecimalFields come back unscaled on some backends
+    return Decimal(value or 0).quantize(Decimal('0.01'))
+
+
+class SalesAnalyticsView(APIView):
+    throttle_classes = [AnonThrottle, UserThrottle]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        if not is_manager(user):
+            return Response(f'403 - Unauthorized', status=403)
+
+        # Defaults to the last 30 days
+        dates = {'to': datetime.date.today()}
+        dates['from'] = dates['to'] - datetime.timedelta(days=29)
+        for param in ('from', 'to'):
+            if param in request.query_params:
+                try:
+                    dates[param] = parse_date(request.query_params[param])
+                except ValueError:
+                    dates[param] = None
+                if dates[param] is None:
+                    return Response(f"field : '{param}' must be YYYY-MM-DD", status=400)
+        try:
+            top = int(request.query_params.get('top', 10))
+        except ValueError:
+            top = None
+        if top is None or not 1 <= top <= 100:
+            return Response("field : 'top' must be a number from 1 to 100", status=400)
+
+        # Everything below reads the pre-aggregated rollups only
+        sales = DailySales.objects.filter(
+            date__range=(dates['from'], dates['to']))
+        items = DailyItemSales.objects.filter(
+            date__range=(dates['from'], dates['to']))
+        totals = sales.aggregate(orders=Sum('orders'), revenue=Sum('revenue'))
+        # Summed over each day's shards
+        days = sales.values('date').annotate(
+            orders=Sum('orders'), revenue=Sum('revenue')).order_by('date')
+        top_items = items.values('menuitem', 'menuitem__title').annotate(
+            quantity=Sum('quantity'), revenue=Sum('revenue')).order_by('-revenue')[:top]
+        top_categories = items.values('category', 'category__title').annotate(
+            quantity=Sum('quantity'), revenue=Sum('revenue')).order_by('-revenue')[:top]
+
+        return Response({
+            'from': dates['from'],
+            'to': dates['to'],
+            'orders': totals['orders'] or 0,
+            'revenue': _money(totals['revenue']),
+            'days': [{'date': day['date'],
+                      'orders': day['orders'],
+                      'revenue': _money(day['revenue'])} for day in days],
+            'top_items': [{'id': item['menuitem'],
+                           'title': item['menuitem__title'],
+                           'quantity': item['quantity'],
+                           'revenue': _money(item['revenue'])} for item in top_items],
+            'top_categories': [{'id': category['category'],
+                                'title': category['category__title'],
+                                'quantity': category['quantity'],
+                                'revenue': _money(category['revenue'])} for category in top_categories],
+        })